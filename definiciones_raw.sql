@@ -1,33 +1,49 @@
 CREATE SCHEMA raw;
 
 CREATE TABLE raw.qb_customer (
-                    id VARCHAR(50) PRIMARY KEY,
+                    realm_id VARCHAR(50) NOT NULL,
+                    id VARCHAR(50) NOT NULL,
                     payload JSONB,
                     ingested_at_utc TIMESTAMPTZ,
                     extract_window_start_utc TIMESTAMPTZ,
                     extract_window_end_utc TIMESTAMPTZ,
                     page_number INTEGER,
                     page_size INTEGER,
-                    request_payload JSONB
+                    request_payload JSONB,
+                    PRIMARY KEY (realm_id, id)
                 );
 CREATE TABLE raw.qb_invoices (
-                    id VARCHAR(50) PRIMARY KEY,
+                    realm_id VARCHAR(50) NOT NULL,
+                    id VARCHAR(50) NOT NULL,
                     payload JSONB,
                     ingested_at_utc TIMESTAMPTZ,
                     extract_window_start_utc TIMESTAMPTZ,
                     extract_window_end_utc TIMESTAMPTZ,
                     page_number INTEGER,
                     page_size INTEGER,
-                    request_payload JSONB
+                    request_payload JSONB,
+                    PRIMARY KEY (realm_id, id)
                 );
 
 CREATE TABLE raw.qb_item (
-                    id VARCHAR(50) PRIMARY KEY,
+                    realm_id VARCHAR(50) NOT NULL,
+                    id VARCHAR(50) NOT NULL,
                     payload JSONB,
                     ingested_at_utc TIMESTAMPTZ,
                     extract_window_start_utc TIMESTAMPTZ,
                     extract_window_end_utc TIMESTAMPTZ,
                     page_number INTEGER,
                     page_size INTEGER,
-                    request_payload JSONB
-                );
\ No newline at end of file
+                    request_payload JSONB,
+                    PRIMARY KEY (realm_id, id)
+                );
+
+-- Tablas creadas con la clave primaria (id): agregar realm_id a la clave.
+-- El realm de cada fila está en request_payload. export_raw_frame lo aplica solo
+-- la primera vez que exporta a una tabla sin realm_id.
+-- ALTER TABLE raw.qb_invoices ADD COLUMN IF NOT EXISTS realm_id VARCHAR(50);
+-- UPDATE raw.qb_invoices SET realm_id = request_payload->>'realm_id' WHERE realm_id IS NULL;
+-- ALTER TABLE raw.qb_invoices ALTER COLUMN realm_id SET NOT NULL;
+-- ALTER TABLE raw.qb_invoices DROP CONSTRAINT IF EXISTS qb_invoices_pkey;
+-- ALTER TABLE raw.qb_invoices ADD PRIMARY KEY (realm_id, id);
+-- (igual para raw.qb_customer y raw.qb_item)
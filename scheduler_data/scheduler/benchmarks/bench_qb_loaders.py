@@ -0,0 +1,218 @@
+"""
+Benchmark de throughput de los loaders ingest_qb_* contra el servidor mock.
+
+Corre cada loader en varios escenarios (sin fallas, latencia, 429, token vencido,
+timeouts) y reporta páginas/s, registros/s, reintentos y latencia p50/p99 por página.
+
+Uso (desde /home/src dentro del contenedor de Mage):
+    python -m scheduler.benchmarks.bench_qb_loaders
+    python -m scheduler.benchmarks.bench_qb_loaders --entities invoices --scenarios baseline latency
+    python -m scheduler.benchmarks.bench_qb_loaders --json resultados.json
+    python -m scheduler.benchmarks.bench_qb_loaders --client async --max-concurrency 64
+    python -m scheduler.benchmarks.bench_qb_loaders --entities full_sync --realms 8
+"""
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from scheduler.benchmarks.qb_mock_server import MockConfig, MockQuickBooksServer
+from scheduler.utils.adaptive_concurrency import get_async_controller, get_controller, reset_controllers
+from scheduler.utils.circuit_breaker import reset_breakers
+from scheduler.utils import qb_async, qb_sync
+
+
+# loader -> (módulo, entidades del mock que lee)
+LOADERS = {
+    'invoices': ('scheduler.data_loaders.ingest_qb_invoices', ['Invoice']),
+    'customers': ('scheduler.data_loaders.ingest_qb_customers', ['Customer']),
+    'items': ('scheduler.data_loaders.ingest_qb_items', ['Item']),
+    'full_sync': ('scheduler.data_loaders.ingest_qb_full_sync', ['Invoice', 'Customer', 'Item']),
+}
+
+# Fallas por escenario, aplicadas sobre MockConfig
+SCENARIOS = {
+    'baseline': {},
+    'latency': {'latency_ms': 50, 'jitter_ms': 50},
+    'throttled': {'throttle_rate': 0.05, 'retry_after_seconds': 1},
+    'token_expiry': {'token_ttl_requests': 20},
+    'timeouts': {'timeout_rate': 0.02, 'timeout_delay_seconds': 3},
+}
+
+MOCK_SECRETS = {
+    'qb_realm_id': 'mock-realm',
+    'qb_access_token': 'mock-access-token',
+    'qb_refresh_token': 'mock-refresh-token',
+    'qb_client_id': 'mock-client-id',
+    'qb_client_secret': 'mock-client-secret',
+}
+
+
+def _mock_realms(count):
+    """
+    Nombres de `count` realms del mock para qb_realms (None: el realm por defecto),
+    con sus secretos qb_<nombre>_* agregados a MOCK_SECRETS.
+    """
+    if count <= 1:
+        return None
+    names = [f'mock{number}' for number in range(1, count + 1)]
+    for name in names:
+        MOCK_SECRETS[f'qb_{name}_realm_id'] = f'mock-realm-{name}'
+        MOCK_SECRETS[f'qb_{name}_access_token'] = 'mock-access-token'
+        MOCK_SECRETS[f'qb_{name}_refresh_token'] = 'mock-refresh-token'
+    return names
+
+
+def _instrument():
+    """
+    Reemplaza fetch_page de QBClient y AsyncQBClient por versiones que miden
+    cada página, y apunta get_secret_value de qb_sync a las credenciales del mock.
+    """
+    original = getattr(qb_sync.QBClient, '_bench_original_fetch', qb_sync.QBClient.fetch_page)
+    qb_sync.QBClient._bench_original_fetch = original
+    original_async = getattr(qb_async.AsyncQBClient, '_bench_original_fetch', qb_async.AsyncQBClient.fetch_page)
+    qb_async.AsyncQBClient._bench_original_fetch = original_async
+    page_seconds = []
+
+    def timed_fetch(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            page_seconds.append(time.perf_counter() - started)
+
+    async def timed_fetch_async(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await original_async(*args, **kwargs)
+        finally:
+            page_seconds.append(time.perf_counter() - started)
+
+    # cada escenario arranca con el circuit breaker cerrado y la concurrencia inicial
+    reset_breakers()
+    reset_controllers()
+    qb_sync.QBClient.fetch_page = timed_fetch
+    qb_async.AsyncQBClient.fetch_page = timed_fetch_async
+    qb_sync.get_secret_value = MOCK_SECRETS.get
+    return page_seconds
+
+
+def run_scenario(loader_name, scenario, records, fecha_inicio, fecha_fin, chunk_days, timeout,
+                 max_concurrency=4, prefetch_pages=0, client='threads', realms=1, verbose=False):
+    module_name, entities = LOADERS[loader_name]
+    module = importlib.import_module(module_name)
+    config = MockConfig(**SCENARIOS[scenario])
+    config.records = {entity: records for entity in entities}
+    config.data_start, config.data_end = fecha_inicio, fecha_fin
+
+    realm_names = _mock_realms(realms)
+    # concurrencia final reportada: la del primer realm
+    first_realm_id = MOCK_SECRETS[f'qb_{realm_names[0]}_realm_id' if realm_names else 'qb_realm_id']
+
+    with MockQuickBooksServer(config) as server, tempfile.TemporaryDirectory() as state_dir:
+        page_seconds = _instrument()
+        kwargs = {
+            'fecha_inicio': fecha_inicio,
+            'fecha_fin': fecha_fin,
+            'chunk_days': chunk_days,
+            'qb_base_url': server.base_url,
+            'qb_token_url': server.token_url,
+            'qb_request_timeout': timeout,
+            # sin tracemalloc del profiler, que infla el tiempo de CPU
+            'profile': False,
+            'max_concurrency': max_concurrency,
+            'prefetch_pages': prefetch_pages,
+            'qb_client': client,
+            'qb_realms': realm_names,
+            # sin límite aprendido de corridas anteriores
+            'concurrency_state_path': os.path.join(state_dir, 'qb_concurrency.json'),
+        }
+        output = io.StringIO()
+        started = time.perf_counter()
+        with contextlib.nullcontext() if verbose else contextlib.redirect_stdout(output):
+            df = module.load_data(**kwargs)
+        elapsed = time.perf_counter() - started
+        stats = server.stats()
+        new_controller = get_async_controller if client == 'async' else get_controller
+        concurrency = new_controller(f'quickbooks:{first_realm_id}').snapshot()
+
+    latencies_ms = np.array(page_seconds) * 1000
+    return {
+        'loader': loader_name,
+        'scenario': scenario,
+        'rows': len(df),
+        'seconds': round(elapsed, 3),
+        'pages': stats['pages'],
+        'pages_per_sec': round(stats['pages'] / elapsed, 2) if elapsed else None,
+        'records_per_sec': round(len(df) / elapsed, 1) if elapsed else None,
+        'retries': stats['throttled'] + stats['unauthorized'] + stats['timeouts'],
+        'throttled': stats['throttled'],
+        'unauthorized': stats['unauthorized'],
+        'timeouts': stats['timeouts'],
+        'token_refreshes': stats['token_refreshes'],
+        'mb_received': round(stats['bytes'] / 1e6, 2),
+        'p50_page_ms': round(float(np.percentile(latencies_ms, 50)), 1) if len(latencies_ms) else None,
+        'p99_page_ms': round(float(np.percentile(latencies_ms, 99)), 1) if len(latencies_ms) else None,
+        'final_concurrency': concurrency['limit'],
+        'max_in_flight': concurrency['max_in_flight'],
+        'complete': len(df) == records * len(entities) * realms,
+    }
+
+
+def print_table(results):
+    columns = ['loader', 'scenario', 'rows', 'seconds', 'pages_per_sec', 'records_per_sec',
+               'retries', 'p50_page_ms', 'p99_page_ms', 'final_concurrency', 'complete']
+    widths = {col: max(len(col), *(len(str(r[col])) for r in results)) for col in columns}
+    print('  '.join(col.ljust(widths[col]) for col in columns))
+    print('  '.join('-' * widths[col] for col in columns))
+    for result in results:
+        print('  '.join(str(result[col]).ljust(widths[col]) for col in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de los loaders ingest_qb_* contra el mock de QuickBooks')
+    parser.add_argument('--entities', nargs='+', choices=sorted(LOADERS), default=sorted(LOADERS))
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--records', type=int, default=5000, help='registros por entidad en el mock')
+    parser.add_argument('--fecha-inicio', default='2025-01-01')
+    parser.add_argument('--fecha-fin', default='2025-03-31')
+    parser.add_argument('--chunk-days', type=int, default=7)
+    parser.add_argument('--timeout', type=float, default=2, help='qb_request_timeout del loader')
+    parser.add_argument('--max-concurrency', type=int, default=4, help='max_concurrency del loader')
+    parser.add_argument('--prefetch-pages', type=int, default=0, help='prefetch_pages del loader (0 = sin prefetch)')
+    parser.add_argument('--client', choices=['threads', 'async'], default='threads', help='qb_client del loader')
+    parser.add_argument('--realms', type=int, default=1, help='realms del mock sincronizados a la vez (qb_realms)')
+    parser.add_argument('--json', help='ruta donde guardar los resultados en JSON')
+    parser.add_argument('--verbose', action='store_true', help='mostrar los logs de los loaders')
+    args = parser.parse_args(argv)
+
+    results = []
+    for loader_name in args.entities:
+        for scenario in args.scenarios:
+            result = run_scenario(
+                loader_name, scenario, args.records, args.fecha_inicio, args.fecha_fin,
+                args.chunk_days, args.timeout, max_concurrency=args.max_concurrency,
+                prefetch_pages=args.prefetch_pages, client=args.client, realms=args.realms, verbose=args.verbose,
+            )
+            results.append(result)
+            print(f"{loader_name}/{scenario}: {result['records_per_sec']} registros/s, "
+                  f"{result['retries']} reintentos")
+
+    print()
+    print_table(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'\nResultados guardados en {args.json}')
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+"""
+Servidor HTTP local que imita el API de QuickBooks Online para benchmarks y pruebas.
+
+Sirve datos sintéticos de Customer, Invoice e Item en
+GET /v3/company/<realm>/query y refresca tokens en POST /oauth2/v1/tokens/bearer,
+con latencia, 429 con Retry-After, 401 por token vencido y timeouts inyectables.
+
+Uso:
+    with MockQuickBooksServer(MockConfig(records={'Invoice': 20000})) as server:
+        load_data(qb_base_url=server.base_url, qb_token_url=server.token_url, ...)
+        print(server.stats())
+"""
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+FILTER_FIELDS = {
+    'Invoice': 'TxnDate',
+    'Customer': 'MetaData.LastUpdatedTime',
+    'Item': 'MetaData.LastUpdatedTime',
+}
+
+_QUERY_RE = re.compile(
+    r"select\s+(?P<fields>.+?)\s+from\s+(?P<entity>\w+)"
+    r"(?:\s+where\s+\S+\s*>=\s*'(?P<start>[^']+)'\s+and\s+\S+\s*<=\s*'(?P<end>[^']+)')?"
+    r"(?:\s+STARTPOSITION\s+(?P<start_position>\d+))?"
+    r"(?:\s+MAXRESULTS\s+(?P<max_results>\d+))?",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class MockConfig:
+    """
+    Volumen y fallas del servidor mock.
+
+    records: registros por entidad, repartidos uniformemente entre data_start y data_end
+    latency_ms: latencia base por página (más jitter_ms aleatorio)
+    throttle_rate: probabilidad de responder 429 con Retry-After = retry_after_seconds
+    token_ttl_requests: requests válidos por access token antes de responder 401 (0 = nunca vence)
+    timeout_rate: probabilidad de demorar timeout_delay_seconds (para provocar timeouts del cliente)
+    line_items: líneas por Invoice, para payloads de tamaño realista
+    """
+    records: dict = field(default_factory=lambda: {'Customer': 2000, 'Invoice': 10000, 'Item': 500})
+    data_start: str = '2025-01-01'
+    data_end: str = '2025-12-31'
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after_seconds: int = 1
+    token_ttl_requests: int = 0
+    timeout_rate: float = 0.0
+    timeout_delay_seconds: float = 5.0
+    line_items: int = 5
+    seed: int = 42
+
+
+def _parse_time(value):
+    if len(value) == 10:
+        value += 'T00:00:00Z'
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+class SyntheticData:
+    """
+    Registros deterministas por índice: el registro i de cada entidad tiene fecha
+    data_start + i * paso, así una ventana de fechas se resuelve con aritmética.
+    """
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.start = _parse_time(config.data_start)
+        self.end = _parse_time(config.data_end) + timedelta(days=1)
+
+    def _step(self, entity):
+        count = max(self.config.records.get(entity, 0), 1)
+        return (self.end - self.start) / count
+
+    def window(self, entity, start, end):
+        """
+        Rango [first, last) de índices con fecha dentro de la ventana cerrada [start, end].
+        """
+        total = self.config.records.get(entity, 0)
+        if start is None:
+            return 0, total
+        step = self._step(entity)
+        first = max(0, -(-(_parse_time(start) - self.start) // step))
+        last = min(total, (_parse_time(end) - self.start) // step + 1)
+        return int(first), int(max(first, last))
+
+    def record(self, entity, index):
+        moment = self.start + self._step(entity) * index
+        timestamp = moment.strftime('%Y-%m-%dT%H:%M:%S-00:00')
+        metadata = {'CreateTime': timestamp, 'LastUpdatedTime': timestamp}
+        record_id = str(index + 1)
+
+        if entity == 'Customer':
+            return {
+                'Id': record_id, 'SyncToken': '0', 'MetaData': metadata,
+                'DisplayName': f'Customer {record_id}', 'CompanyName': f'Company {record_id}',
+                'Active': True, 'Balance': round(index * 1.37 % 5000, 2),
+                'PrimaryEmailAddr': {'Address': f'customer{record_id}@example.com'},
+                'BillAddr': {'Line1': f'{index} Main St', 'City': 'Quito', 'Country': 'EC'},
+            }
+        if entity == 'Item':
+            return {
+                'Id': record_id, 'SyncToken': '0', 'MetaData': metadata,
+                'Name': f'Item {record_id}', 'Type': 'Service', 'Active': True,
+                'UnitPrice': round(10 + index % 90, 2),
+                'IncomeAccountRef': {'value': '79', 'name': 'Sales of Product Income'},
+            }
+        lines = [
+            {
+                'Id': str(line + 1), 'LineNum': line + 1, 'Amount': 25.0,
+                'DetailType': 'SalesItemLineDetail',
+                'Description': f'Line {line + 1} of invoice {record_id}',
+                'SalesItemLineDetail': {
+                    'ItemRef': {'value': str(line % 50 + 1), 'name': f'Item {line % 50 + 1}'},
+                    'UnitPrice': 25, 'Qty': 1,
+                },
+            }
+            for line in range(self.config.line_items)
+        ]
+        return {
+            'Id': record_id, 'SyncToken': '0', 'MetaData': metadata,
+            'DocNumber': f'INV-{record_id}', 'TxnDate': moment.strftime('%Y-%m-%d'),
+            'CustomerRef': {'value': str(index % 200 + 1)},
+            'Line': lines, 'TotalAmt': 25.0 * len(lines), 'Balance': 0,
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = 'MockQuickBooks/1.0'
+
+    def log_message(self, format, *args):  # silenciar el log por request
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+        return len(payload)
+
+    def do_POST(self):
+        mock = self.server.mock
+        if not self.path.startswith('/oauth2/v1/tokens/bearer'):
+            self._send_json(404, {'error': 'not found'})
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        token = mock.issue_token()
+        mock.record('token', 200, 0, 0)
+        self._send_json(200, {
+            'access_token': token, 'refresh_token': 'mock-refresh-token',
+            'token_type': 'bearer', 'expires_in': 3600,
+        })
+
+    def do_GET(self):
+        mock = self.server.mock
+        config = mock.config
+        started = time.perf_counter()
+        url = urlparse(self.path)
+        if not re.match(r'^/v3/company/[^/]+/query$', url.path):
+            self._send_json(404, {'error': 'not found'})
+            return
+
+        token = self.headers.get('Authorization', '').replace('Bearer ', '')
+        if not mock.use_token(token):
+            mock.record('query', 401, 0, time.perf_counter() - started)
+            self._send_json(401, {'fault': {'type': 'AUTHENTICATION'}})
+            return
+
+        rng = mock.rng()
+        if config.throttle_rate and rng.random() < config.throttle_rate:
+            mock.record('query', 429, 0, time.perf_counter() - started)
+            self._send_json(429, {'fault': {'type': 'THROTTLE'}},
+                            {'Retry-After': str(config.retry_after_seconds)})
+            return
+        if config.timeout_rate and rng.random() < config.timeout_rate:
+            time.sleep(config.timeout_delay_seconds)
+            mock.record('timeout', 0, 0, time.perf_counter() - started)
+            return
+
+        delay = config.latency_ms + (rng.random() * config.jitter_ms if config.jitter_ms else 0)
+        if delay:
+            time.sleep(delay / 1000)
+
+        match = _QUERY_RE.search(parse_qs(url.query).get('query', [''])[0])
+        if not match:
+            mock.record('query', 400, 0, time.perf_counter() - started)
+            self._send_json(400, {'fault': {'type': 'ValidationFault'}})
+            return
+
+        entity = match.group('entity')
+        first, last = mock.data.window(entity, match.group('start'), match.group('end'))
+        start_position = int(match.group('start_position') or 1)
+        max_results = int(match.group('max_results') or 100)
+        begin = first + start_position - 1
+        indices = range(begin, min(last, begin + max_results))
+
+        fields = [f.strip() for f in match.group('fields').split(',')]
+        records = [mock.data.record(entity, index) for index in indices]
+        if fields != ['*']:
+            records = [{key: value for key, value in record.items() if key in fields} for record in records]
+
+        query_response = {'startPosition': start_position, 'maxResults': len(records)}
+        if records:
+            query_response[entity] = records
+        size = self._send_json(200, {'QueryResponse': query_response, 'time': datetime.now(timezone.utc).isoformat()})
+        mock.record('query', 200, len(records), time.perf_counter() - started, size)
+
+
+class MockQuickBooksServer:
+    """
+    Levanta el mock en un hilo de fondo (puerto libre por defecto) y acumula estadísticas.
+    """
+
+    def __init__(self, config: MockConfig = None, host='127.0.0.1', port=0):
+        self.config = config or MockConfig()
+        self.data = SyntheticData(self.config)
+        self._lock = threading.Lock()
+        self._random = random.Random(self.config.seed)
+        self._tokens = {'mock-access-token': 0}
+        self._token_counter = 0
+        self._stats = []
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.mock = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def token_url(self):
+        return f'{self.base_url}/oauth2/v1/tokens/bearer'
+
+    def rng(self):
+        with self._lock:
+            return random.Random(self._random.random())
+
+    def issue_token(self):
+        with self._lock:
+            self._token_counter += 1
+            token = f'mock-token-{self._token_counter}'
+            self._tokens[token] = 0
+            return token
+
+    def use_token(self, token):
+        with self._lock:
+            if token not in self._tokens:
+                return False
+            self._tokens[token] += 1
+            ttl = self.config.token_ttl_requests
+            return not ttl or self._tokens[token] <= ttl
+
+    def record(self, kind, status, records, seconds, size=0):
+        with self._lock:
+            self._stats.append((kind, status, records, seconds, size))
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = []
+
+    def stats(self):
+        with self._lock:
+            rows = list(self._stats)
+        summary = {'requests': 0, 'pages': 0, 'records': 0, 'bytes': 0,
+                   'throttled': 0, 'unauthorized': 0, 'timeouts': 0, 'token_refreshes': 0}
+        for kind, status, records, _, size in rows:
+            if kind == 'token':
+                summary['token_refreshes'] += 1
+                continue
+            summary['requests'] += 1
+            if kind == 'timeout':
+                summary['timeouts'] += 1
+            elif status == 429:
+                summary['throttled'] += 1
+            elif status == 401:
+                summary['unauthorized'] += 1
+            elif status == 200:
+                summary['pages'] += 1
+                summary['records'] += records
+                summary['bytes'] += size
+        return summary
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Servidor mock del API de QuickBooks')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--invoices', type=int, default=10000)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--throttle-rate', type=float, default=0)
+    args = parser.parse_args()
+
+    config = MockConfig(latency_ms=args.latency_ms, throttle_rate=args.throttle_rate)
+    config.records['Invoice'] = args.invoices
+    server = MockQuickBooksServer(config, port=args.port)
+    print(f'Mock QuickBooks en {server.base_url} (token: {server.token_url})')
+    server._httpd.serve_forever()
@@ -0,0 +1,59 @@
+from mage_ai.settings.repo import get_repo_path
+from mage_ai.io.config import ConfigFileLoader
+from mage_ai.io.postgres import Postgres
+from pandas import DataFrame
+from os import path
+from scheduler.utils.profiling import profile_block
+from scheduler.utils.qb_export import export_raw_frame
+from scheduler.utils.qb_sync import get_entity
+
+if 'data_exporter' not in globals():
+    from mage_ai.data_preparation.decorators import data_exporter
+
+
+@data_exporter
+@profile_block('export_qb_full_sync')
+def export_data_to_postgres(df: DataFrame, **kwargs) -> None:
+    """
+    UPSERT de la salida de ingest_qb_full_sync: las filas de cada entidad van a
+    su tabla del registro QB_ENTITIES, todas sobre una misma conexión. En
+    qb_backfill_dynamic corre una vez por chunk, después de fetch_qb_chunk.
+
+    export_method: 'copy' (default), 'batched' o 'row', como en export_qb_invoices.
+    """
+    if df.empty:
+        print("DataFrame vacío, no hay datos para exportar")
+        return
+
+    schema_name = 'raw'
+    config_path = path.join(get_repo_path(), 'io_config.yaml')
+    config_profile = 'default'
+    export_method = kwargs.get('export_method', 'copy')
+
+    with Postgres.with_config(ConfigFileLoader(config_path, config_profile)) as loader:
+        # Limpiar cualquier transacción pendiente al inicio
+        try:
+            loader.execute("ROLLBACK;")
+        except:
+            pass  # Ignorar si no hay transacción pendiente
+
+        # Verificar conexión
+        try:
+            test_result = loader.execute("SELECT version();")
+            print(f"Conectado a PostgreSQL: {test_result[0][0] if test_result else 'Versión no disponible'}")
+        except Exception as e:
+            print(f"Error verificando conexión: {e}")
+            return
+
+        results = {}
+        for name, frame in df.groupby('entity', sort=False):
+            table_name = get_entity(name).table
+            results[name] = export_raw_frame(
+                loader, frame.drop(columns='entity'), schema_name, table_name, export_method=export_method,
+            )
+
+    print(f"\nSINCRONIZACIÓN COMPLETA EXPORTADA ({export_method})")
+    for name, stats in results.items():
+        print(f"  {name}: {stats['inserted']} insertados, {stats['updated']} actualizados, "
+              f"{stats['errors']} errores, {stats['final_count']} en tabla")
+    print("Idempotencia garantizada: re-ejecutar con los mismos IDs no duplicará filas")
@@ -1,16 +1,64 @@
 from mage_ai.io.file import FileIO
 from pandas import DataFrame
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
 
 if 'data_exporter' not in globals():
     from mage_ai.data_preparation.decorators import data_exporter
 
 
+EXPORT_FORMATS = ('csv', 'parquet', 'feather')
+
+
+def titanic_clean_schema():
+    """
+    Explicit Arrow schema for the output of fill_in_missing_values, so the file
+    types don't depend on what pandas inferred for a given batch.
+    """
+    return pa.schema([
+        ('Age', pa.float64()),
+        ('Fare', pa.float64()),
+        ('Parch', pa.int64()),
+        ('Pclass', pa.int64()),
+        ('SibSp', pa.int64()),
+        ('Survived', pa.int64()),
+    ])
+
+
+def export_columnar(df: DataFrame, filepath: str, export_format: str, compression: str) -> None:
+    schema = titanic_clean_schema()
+    table = pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+    # parquet spells "no codec" 'none' and feather 'uncompressed'; accept either for both
+    uncompressed = compression in ('none', 'uncompressed')
+
+    if export_format == 'parquet':
+        pq.write_table(table, filepath, compression='none' if uncompressed else compression)
+    else:
+        # Arrow IPC (Feather v2); uncompressed files can be memory-mapped by readers.
+        feather.write_feather(table, filepath, compression='uncompressed' if uncompressed else compression)
+
+
 @data_exporter
 def export_data_to_file(df: DataFrame, **kwargs) -> None:
     """
     Template for exporting data to filesystem.
 
+    Pipeline variables:
+        export_format (str): 'csv' (default), 'parquet' or 'feather'
+        compression (str): codec for parquet/feather, e.g. 'zstd' (default),
+            'lz4', 'snappy' (parquet only) or 'none' (no compression)
+
     Docs: https://docs.mage.ai/design/data-loading#example-loading-data-from-a-file
     """
-    filepath = 'titanic_clean.csv'
-    FileIO().export(df, filepath)
+    export_format = kwargs.get('export_format', 'csv')
+    compression = kwargs.get('compression', 'zstd')
+
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'export_format must be one of {EXPORT_FORMATS}, got {export_format!r}')
+
+    filepath = f'titanic_clean.{export_format}'
+    if export_format == 'csv':
+        FileIO().export(df, filepath)
+    else:
+        export_columnar(df, filepath, export_format, compression)
@@ -2,31 +2,313 @@ from mage_ai.settings.repo import get_repo_path
 from mage_ai.io.config import ConfigFileLoader
 from mage_ai.io.postgres import Postgres
 from pandas import DataFrame
+from pandas.api import types as ptypes
 from os import path
+from scheduler.utils.pg_copy import copy_frame, qualified_name, quote_ident
+from scheduler.utils.taxi_rollup import (
+    PICKUP_COLUMN,
+    ROLLUP_KEYS,
+    ROLLUP_MEASURES,
+    ROLLUP_TABLE,
+    build_hourly_rollup,
+)
 
 if 'data_exporter' not in globals():
     from mage_ai.data_preparation.decorators import data_exporter
 
 
+PARTITION_COLUMN = PICKUP_COLUMN
+EXPORT_MODES = ('replace', 'append', 'partition_swap')
+
+
+INTEGER_TYPES = ('smallint', 'integer', 'bigint')
+
+
+def _sql_type(dtype) -> str:
+    if ptypes.is_bool_dtype(dtype):
+        return 'BOOLEAN'
+    if ptypes.is_integer_dtype(dtype):
+        return 'BIGINT'
+    if ptypes.is_float_dtype(dtype):
+        return 'DOUBLE PRECISION'
+    if ptypes.is_datetime64_any_dtype(dtype):
+        return 'TIMESTAMP'
+    return 'TEXT'
+
+
+def _column_ddl(df: DataFrame) -> str:
+    """
+    Builds the column list for the partitioned parent table from the frame dtypes.
+    """
+    return ', '.join(f'{quote_ident(col)} {_sql_type(dtype)}' for col, dtype in df.dtypes.items())
+
+
+def _table_columns(cursor, schema_name: str, table_name: str) -> dict:
+    cursor.execute(
+        """
+        SELECT column_name, data_type
+        FROM information_schema.columns
+        WHERE table_schema = %s AND table_name = %s
+        """,
+        (schema_name, table_name),
+    )
+    return dict(cursor.fetchall())
+
+
+def _align_to_table(cursor, df: DataFrame, schema_name: str, table_name: str) -> DataFrame:
+    """
+    Fits the batch to the existing parent table before COPY.
+
+    Columns the table does not have yet (e.g. is_valid or the trip metrics added
+    after the table was created) are added as nullable columns. Integer table
+    columns are sent as nullable Int64: a batch with NULLs in an int column
+    arrives as float64, and COPY rejects "1.0" for BIGINT.
+    """
+    table_columns = _table_columns(cursor, schema_name, table_name)
+    parent = qualified_name(schema_name, table_name)
+
+    for col in df.columns:
+        if col not in table_columns:
+            sql_type = _sql_type(df[col].dtype)
+            cursor.execute(f'ALTER TABLE {parent} ADD COLUMN {quote_ident(col)} {sql_type}')
+            table_columns[col] = sql_type.lower()
+            print(f'Added column {col} ({sql_type}) to {schema_name}.{table_name}')
+
+    df = df.copy()
+    for col in df.columns:
+        if table_columns[col] not in INTEGER_TYPES or ptypes.is_bool_dtype(df[col].dtype):
+            continue
+        values = df[col]
+        if ptypes.is_float_dtype(values.dtype):
+            present = values.dropna()
+            if not (present == present.round()).all():
+                raise ValueError(
+                    f'{schema_name}.{table_name}.{col} is {table_columns[col]} but the batch has '
+                    f'fractional values (e.g. {present[present != present.round()].iloc[0]})'
+                )
+        if ptypes.is_numeric_dtype(values.dtype):
+            df[col] = values.astype('Int64')
+    return df
+
+
+def _relation_kind(cursor, schema_name: str, table_name: str):
+    cursor.execute(
+        """
+        SELECT c.relkind
+        FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relname = %s
+        """,
+        (schema_name, table_name),
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _ensure_partitioned_parent(cursor, df: DataFrame, schema_name: str, table_name: str) -> None:
+    kind = _relation_kind(cursor, schema_name, table_name)
+    if kind == 'p':
+        return
+    if kind is not None:
+        raise ValueError(
+            f'{schema_name}.{table_name} exists but is not partitioned; '
+            f"drop or rename it, then re-run with export_mode='partition_swap' to create the partitioned table"
+        )
+    cursor.execute(
+        f'CREATE TABLE {qualified_name(schema_name, table_name)} ({_column_ddl(df)}) '
+        f'PARTITION BY RANGE ({quote_ident(PARTITION_COLUMN)})'
+    )
+
+
+def _month_slices(df: DataFrame):
+    """
+    Yields (partition_suffix, lower_bound, upper_bound, rows) per pickup month.
+    """
+    months = df[PARTITION_COLUMN].dt.to_period('M')
+    for month, rows in df.groupby(months, sort=True):
+        lower = month.start_time
+        upper = (month + 1).start_time
+        yield month.strftime('%Y_%m'), lower.isoformat(sep=' '), upper.isoformat(sep=' '), rows
+
+
+def _export_partitioned(conn, df: DataFrame, schema_name: str, table_name: str,
+                        export_mode: str, maintain_rollups: bool) -> None:
+    """
+    Loads the frame month by month into range partitions of `table_name`.
+
+    append: COPY straight into the month partition (created if missing).
+    partition_swap: COPY each month into a staging table first (committed, not
+        yet visible), then swap the staging tables for the months' partitions,
+        so readers see either the old or the new month, never an empty one.
+
+    The appends or swaps and the rollup update share one transaction: a failed
+    rollup leaves the months untouched and a retry cannot count a batch twice.
+    """
+    parent = qualified_name(schema_name, table_name)
+    column = quote_ident(PARTITION_COLUMN)
+
+    try:
+        with conn.cursor() as cursor:
+            _ensure_partitioned_parent(cursor, df, schema_name, table_name)
+            df = _align_to_table(cursor, df, schema_name, table_name)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    months = list(_month_slices(df))
+
+    try:
+        with conn.cursor() as cursor:
+            if export_mode == 'partition_swap':
+                for suffix, lower, upper, rows in months:
+                    staging_name = f'{table_name}_{suffix}_staging'
+                    staging = qualified_name(schema_name, staging_name)
+                    cursor.execute(f'DROP TABLE IF EXISTS {staging}')
+                    cursor.execute(f'CREATE TABLE {staging} (LIKE {parent} INCLUDING DEFAULTS)')
+                    copy_frame(cursor, rows, staging, columns=list(df.columns))
+                    # Matching CHECK lets ATTACH skip the validation scan of the new partition.
+                    cursor.execute(
+                        f'ALTER TABLE {staging} ADD CONSTRAINT {quote_ident(staging_name + "_bounds")} '
+                        f"CHECK ({column} IS NOT NULL AND {column} >= '{lower}' AND {column} < '{upper}')"
+                    )
+                    conn.commit()
+
+            # Load/swap + rollup: the parent is only locked from here to the commit.
+            for suffix, lower, upper, rows in months:
+                partition_name = f'{table_name}_{suffix}'
+                partition = qualified_name(schema_name, partition_name)
+                bounds = f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+
+                if export_mode == 'append':
+                    if _relation_kind(cursor, schema_name, partition_name) is None:
+                        cursor.execute(f'CREATE TABLE {partition} PARTITION OF {parent} {bounds}')
+                    copy_frame(cursor, rows, partition, columns=list(df.columns))
+                    continue
+
+                staging_name = f'{partition_name}_staging'
+                staging = qualified_name(schema_name, staging_name)
+                if _relation_kind(cursor, schema_name, partition_name) is not None:
+                    cursor.execute(f'ALTER TABLE {parent} DETACH PARTITION {partition}')
+                    cursor.execute(f'DROP TABLE {partition}')
+                cursor.execute(f'ALTER TABLE {staging} RENAME TO {quote_ident(partition_name)}')
+                cursor.execute(f'ALTER TABLE {parent} ATTACH PARTITION {partition} {bounds}')
+                cursor.execute(
+                    f'ALTER TABLE {partition} DROP CONSTRAINT {quote_ident(staging_name + "_bounds")}'
+                )
+
+            if maintain_rollups:
+                _update_rollup(cursor, df, schema_name, export_mode)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    verb = 'Appended' if export_mode == 'append' else 'Swapped in'
+    for suffix, _, _, rows in months:
+        print(f'{verb} {len(rows)} rows as {schema_name}.{table_name}_{suffix}')
+
+
+def _update_rollup(cursor, df: DataFrame, schema_name: str, export_mode: str) -> None:
+    """
+    Folds the batch into the rollup table. The caller owns the transaction, so
+    the rollup commits together with the rows it summarizes.
+
+    replace: the batch is the whole table, so the rollup is rebuilt.
+    partition_swap: the batch months were replaced, so only their slice of the
+        rollup is deleted and recomputed.
+    append: batch totals are added onto the existing rollup rows.
+    """
+    rollup = build_hourly_rollup(df)
+    target = qualified_name(schema_name, ROLLUP_TABLE)
+    keys = ', '.join(quote_ident(col) for col in ROLLUP_KEYS)
+    columns = ', '.join(quote_ident(col) for col in ROLLUP_KEYS + ROLLUP_MEASURES)
+
+    cursor.execute(
+        f'CREATE TABLE IF NOT EXISTS {target} ('
+        f'"hour_start" TIMESTAMP NOT NULL, "PULocationID" BIGINT NOT NULL, '
+        f'"payment_type" BIGINT NOT NULL, "trips" BIGINT NOT NULL, '
+        f'"revenue" DOUBLE PRECISION NOT NULL, "distance" DOUBLE PRECISION NOT NULL, '
+        f'PRIMARY KEY ({keys}))'
+    )
+
+    if export_mode == 'replace':
+        cursor.execute(f'TRUNCATE {target}')
+        copy_frame(cursor, rollup, target)
+    elif export_mode == 'partition_swap':
+        for _, lower, upper, _ in _month_slices(df):
+            cursor.execute(
+                f'DELETE FROM {target} WHERE "hour_start" >= %s AND "hour_start" < %s',
+                (lower, upper),
+            )
+        copy_frame(cursor, rollup, target)
+    else:
+        cursor.execute(
+            f'CREATE TEMP TABLE rollup_batch (LIKE {target}) ON COMMIT DROP'
+        )
+        copy_frame(cursor, rollup, 'rollup_batch')
+        updates = ', '.join(
+            f'{quote_ident(col)} = {target}.{quote_ident(col)} + EXCLUDED.{quote_ident(col)}'
+            for col in ROLLUP_MEASURES
+        )
+        cursor.execute(
+            f'INSERT INTO {target} ({columns}) SELECT {columns} FROM rollup_batch '
+            f'ON CONFLICT ({keys}) DO UPDATE SET {updates}'
+        )
+
+    print(f'Rollup {schema_name}.{ROLLUP_TABLE} updated with {len(rollup)} rows ({export_mode})')
+
+
 @data_exporter
 def export_data_to_postgres(df: DataFrame, **kwargs) -> None:
     """
     Template for exporting data to a PostgreSQL database.
     Specify your configuration settings in 'io_config.yaml'.
 
+    Pipeline variables:
+        export_mode (str): 'replace' (default) rebuilds the table through
+            `loader.export`; 'append' and 'partition_swap' keep `taxi_trips`
+            range-partitioned by pickup month and load with COPY, touching only
+            the months present in the frame.
+        maintain_rollups (bool): keep public.taxi_trips_hourly_rollup in step
+            with each batch (default: True).
+
     Docs: https://docs.mage.ai/design/data-loading#postgresql
     """
     schema_name = 'public'  # Specify the name of the schema to export data to
     table_name = 'taxi_trips'  # Specify the name of the table to export data to
     config_path = path.join(get_repo_path(), 'io_config.yaml')
     config_profile = 'default'
+    export_mode = kwargs.get('export_mode', 'replace')
+    maintain_rollups = kwargs.get('maintain_rollups', True)
+
+    if export_mode not in EXPORT_MODES:
+        raise ValueError(f'export_mode must be one of {EXPORT_MODES}, got {export_mode!r}')
 
     with Postgres.with_config(ConfigFileLoader(config_path, config_profile)) as loader:
-        loader.export(
-            df,
-            schema_name,
-            table_name,
-            index=False,  # Specifies whether to include index in exported table
-            if_exists='replace',  # Specify resolution policy if table name already exists
-        )
-        
\ No newline at end of file
+        if export_mode == 'replace':
+            loader.export(
+                df,
+                schema_name,
+                table_name,
+                index=False,  # Specifies whether to include index in exported table
+                if_exists='replace',  # Specify resolution policy if table name already exists
+            )
+        else:
+            unpartitioned = df[PARTITION_COLUMN].isna()
+            if unpartitioned.any():
+                print(f'Skipping {int(unpartitioned.sum())} rows without {PARTITION_COLUMN}')
+                df = df[~unpartitioned]
+
+            _export_partitioned(loader.conn, df, schema_name, table_name, export_mode, maintain_rollups)
+            return
+
+        # loader.export commits on its own; the rollup is rebuilt from the whole
+        # table here, so re-running after a failure converges.
+        if maintain_rollups:
+            try:
+                with loader.conn.cursor() as cursor:
+                    _update_rollup(cursor, df, schema_name, export_mode)
+                loader.conn.commit()
+            except Exception:
+                loader.conn.rollback()
+                raise
@@ -0,0 +1,50 @@
+import pandas as pd
+from scheduler.utils.profiling import profile_block
+from scheduler.utils.qb_sync import QB_ENTITIES, run_sync
+
+
+if 'data_loader' not in globals():
+    from mage_ai.data_preparation.decorators import data_loader
+if 'test' not in globals():
+    from mage_ai.data_preparation.decorators import test
+
+
+@data_loader
+@profile_block('ingest_qb_full_sync')
+def load_data(*args, **kwargs):
+    """
+    Backfill de todas las entidades de QuickBooks en paralelo con un solo cliente:
+    un refresh de token, una sesión HTTP y un límite de concurrencia por realm.
+    La corrida dura lo que la entidad más lenta, no la suma de las tres.
+
+    Args:
+        qb_entities (list): entidades del registro QB_ENTITIES a sincronizar
+            (opcional, default: todas)
+        Los demás (fecha_inicio, fecha_fin, chunk_days, qb_fields, max_concurrency,
+        qb_realms, ...) son los de scheduler.utils.qb_sync.run_sync y aplican a todas
+        las entidades.
+
+    Returns:
+        pandas.DataFrame: filas raw de todas las entidades, con la columna `entity`
+            (clave del registro) para que el exporter elija la tabla destino
+    """
+    entity_names = kwargs.get('qb_entities') or list(QB_ENTITIES)
+    frames = run_sync(entity_names, **kwargs)
+
+    df = pd.concat(
+        [frame.assign(entity=name) for name, frame in frames.items() if not frame.empty],
+        ignore_index=True,
+    ) if any(not frame.empty for frame in frames.values()) else pd.DataFrame()
+
+    for name, frame in frames.items():
+        print(f"{name}: {len(frame)} filas")
+    print(f"\nDataFrame creado con {len(df)} filas de {len(frames)} entidades")
+    return df
+
+
+@test
+def test_output(output, *args) -> None:
+    """
+    Template code for testing the output of the block.
+    """
+    assert output is not None, 'The output is undefined'
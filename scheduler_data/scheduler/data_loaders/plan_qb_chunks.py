@@ -0,0 +1,54 @@
+from scheduler.utils.qb_sync import QB_ENTITIES, plan_chunks
+
+
+if 'data_loader' not in globals():
+    from mage_ai.data_preparation.decorators import data_loader
+if 'test' not in globals():
+    from mage_ai.data_preparation.decorators import test
+
+
+@data_loader
+def load_data(*args, **kwargs):
+    """
+    Planificador del backfill dinámico (bloque con `dynamic: true`): emite un
+    item por entidad y chunk de fechas, y Mage crea un fetch_qb_chunk y un
+    export_qb_full_sync por cada uno. Cada chunk tiene así sus propios
+    reintentos, logs y variables, y los chunks corren en paralelo hasta
+    concurrency_config.block_run_limit del pipeline.
+
+    Args:
+        fecha_inicio (str): Fecha de inicio en formato YYYY-MM-DD
+        fecha_fin (str): Fecha de fin en formato YYYY-MM-DD
+        chunk_days (int): Número de días por chunk (opcional, default: 7)
+        qb_entities (list): entidades del registro QB_ENTITIES (opcional, default: todas)
+        qb_realms (list): realms a repartir, como en run_sync (qb_sync); un chunk
+            por realm, entidad y ventana (opcional, default: el realm por defecto)
+
+    Returns:
+        list: [chunks, metadata] en el formato de bloques dinámicos de Mage
+    """
+    entity_names = kwargs.get('qb_entities') or list(QB_ENTITIES)
+    realm_names = kwargs.get('qb_realms')
+    chunks = plan_chunks(entity_names, kwargs.get('fecha_inicio'), kwargs.get('fecha_fin'),
+                         kwargs.get('chunk_days', 7), realm_names)
+    metadata = [
+        {'block_uuid': '_'.join(
+            ([chunk['realm']] if 'realm' in chunk else []) + [chunk['entity'], chunk['start_date'], chunk['end_date']]
+        )}
+        for chunk in chunks
+    ]
+
+    print(f"Plan: {len(chunks)} chunks de {', '.join(entity_names)} "
+          f"entre {kwargs.get('fecha_inicio')} y {kwargs.get('fecha_fin')}"
+          + (f" para {len(realm_names)} realms" if realm_names else ''))
+    return [chunks, metadata]
+
+
+@test
+def test_output(output, *args) -> None:
+    """
+    Template code for testing the output of the block.
+    """
+    assert output is not None, 'The output is undefined'
+    chunks, metadata = output
+    assert len(chunks) == len(metadata), 'Cada chunk necesita su metadata'
@@ -0,0 +1,58 @@
+"""
+Controladores AIMD compartidos por proceso: la configuración de cada corrida
+(max_concurrency) se aplica aunque el controlador ya exista.
+
+Correr desde /home/src dentro del contenedor de Mage:
+    python -m pytest scheduler/tests
+"""
+import pytest
+
+from scheduler.utils.adaptive_concurrency import get_async_controller, get_controller, reset_controllers
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry():
+    reset_controllers()
+    yield
+    reset_controllers()
+
+
+def grow(controller, windows):
+    for _ in range(windows):
+        for _ in range(controller.limit):
+            controller.on_success(0.1)
+
+
+@pytest.mark.parametrize('lookup', [get_controller, get_async_controller])
+def test_lower_max_limit_clamps_learned_limit(lookup):
+    controller = lookup('quickbooks:1', initial_limit=2, max_limit=8)
+    grow(controller, 10)
+    assert controller.limit == 8
+
+    assert lookup('quickbooks:1', initial_limit=2, max_limit=4) is controller
+    assert controller.max_limit == 4
+    assert controller.limit == 4
+
+
+@pytest.mark.parametrize('lookup', [get_controller, get_async_controller])
+def test_learned_limit_survives_new_initial_limit(lookup):
+    controller = lookup('quickbooks:1', initial_limit=2, max_limit=8)
+    grow(controller, 3)
+    learned = controller.limit
+
+    lookup('quickbooks:1', initial_limit=1, max_limit=8)
+    assert controller.limit == learned
+
+    # sin config (p. ej. el cliente) no cambia nada
+    lookup('quickbooks:1')
+    assert controller.max_limit == 8 and controller.limit == learned
+
+
+def test_raised_max_limit_lets_the_limit_grow():
+    controller = get_controller('quickbooks:1', initial_limit=2, max_limit=3)
+    grow(controller, 5)
+    assert controller.limit == 3
+
+    get_controller('quickbooks:1', max_limit=6)
+    grow(controller, 5)
+    assert controller.limit == 6
@@ -0,0 +1,56 @@
+"""
+Rollup horario de ny_taxi_exporter (utils/taxi_rollup) con payment_type nulo (como en 2021-01).
+
+Correr desde /home/src dentro del contenedor de Mage:
+    python -m pytest scheduler/tests
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from scheduler.utils.pg_copy import copy_frame
+from scheduler.utils.taxi_rollup import ROLLUP_TABLE, UNKNOWN_KEY, build_hourly_rollup
+
+
+class CopyCursor:
+    """Cursor que guarda el CSV enviado por COPY en lugar de escribirlo."""
+
+    def __init__(self):
+        self.payloads = []
+
+    def copy_expert(self, sql, buffer):
+        self.payloads.append(buffer.read())
+
+
+@pytest.fixture
+def trips():
+    # payment_type con NaN: pandas lo guarda como float64
+    return pd.DataFrame({
+        'tpep_pickup_datetime': pd.to_datetime([
+            '2021-01-01 00:05', '2021-01-01 00:20', '2021-01-01 00:40', '2021-01-01 01:10',
+        ]),
+        'PULocationID': [142, 142, 142, 236],
+        'payment_type': [1.0, np.nan, np.nan, 2.0],
+        'total_amount': [10.0, 20.0, 5.0, 7.5],
+        'trip_distance': [1.0, 2.5, 0.5, 1.2],
+    })
+
+
+def test_rollup_keeps_trips_without_payment_type(trips):
+    rollup = build_hourly_rollup(trips)
+
+    assert rollup['trips'].sum() == len(trips)
+    assert rollup['payment_type'].dtype == 'int64'
+    assert rollup['PULocationID'].dtype == 'int64'
+    unknown = rollup[rollup['payment_type'] == UNKNOWN_KEY]
+    assert unknown['trips'].tolist() == [2]
+    assert unknown['revenue'].tolist() == [25.0]
+
+
+def test_rollup_csv_has_integer_keys(trips):
+    cursor = CopyCursor()
+    copy_frame(cursor, build_hourly_rollup(trips), ROLLUP_TABLE)
+
+    for line in cursor.payloads[0].splitlines():
+        _, pu_location, payment_type, trips_count = line.split(',')[:4]
+        assert pu_location.isdigit() and payment_type.isdigit() and trips_count.isdigit()
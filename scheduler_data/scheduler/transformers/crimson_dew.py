@@ -1,37 +0,0 @@
-from mage_ai.data_cleaner.transformer_actions.base import BaseAction
-from mage_ai.data_cleaner.transformer_actions.constants import ActionType, Axis
-from mage_ai.data_cleaner.transformer_actions.utils import build_transformer_action
-from pandas import DataFrame
-
-if 'transformer' not in globals():
-    from mage_ai.data_preparation.decorators import transformer
-if 'test' not in globals():
-    from mage_ai.data_preparation.decorators import test
-
-
-@transformer
-def execute_transformer_action(df: DataFrame, *args, **kwargs) -> DataFrame:
-    """
-    Execute Transformer Action: ActionType.DIFF
-
-    Calculates difference from previous row along column.
-
-    Docs: https://docs.mage.ai/guides/transformer-blocks#difference
-    """
-    action = build_transformer_action(
-        df,
-        action_type=ActionType.DIFF,
-        arguments=[],  # Specify at most one column to compute difference with
-        axis=Axis.COLUMN,
-        outputs=[{'uuid': 'new_diff_column', 'column_type': 'number_with_decimals'}],
-    )
-
-    return BaseAction(action).execute(df)
-
-
-@test
-def test_output(output, *args) -> None:
-    """
-    Template code for testing the output of the block.
-    """
-    assert output is not None, 'The output is undefined'
@@ -0,0 +1,62 @@
+from datetime import datetime
+from scheduler.utils.profiling import profile_block
+from scheduler.utils.qb_sync import run_sync
+
+if 'transformer' not in globals():
+    from mage_ai.data_preparation.decorators import transformer
+if 'test' not in globals():
+    from mage_ai.data_preparation.decorators import test
+
+
+@transformer
+@profile_block('fetch_qb_chunk')
+def fetch_chunk(chunk, *args, **kwargs):
+    """
+    Bloque hijo de plan_qb_chunks: lee una sola ventana de una entidad.
+
+    La ventana se lee como un único chunk (con los reintentos en sub-ventanas de
+    qb_sync). Si aun así falla, el bloque falla para que Mage lo reintente según
+    su retry_config, sin tocar el resto de los chunks; por eso no se guardan
+    ventanas fallidas en .variables/qb_failed_chunks.json. Tampoco aplica
+    time_budget_seconds: un hijo cortado a mitad de ventana dejaría un hueco
+    sin checkpoint (el plazo se controla con el timeout del bloque).
+
+    Args:
+        chunk (dict): item del planificador: entity, chunk_number, start_date, end_date
+            y, en planes multi-realm, realm
+        Los demás kwargs (qb_fields, log_level, max_concurrency, ...) son los
+        de scheduler.utils.qb_sync.run_sync.
+
+    Returns:
+        pandas.DataFrame: filas raw de la ventana con la columna `entity`,
+            el formato que espera export_qb_full_sync
+    """
+    start_date = datetime.strptime(chunk['start_date'], '%Y-%m-%d').date()
+    end_date = datetime.strptime(chunk['end_date'], '%Y-%m-%d').date()
+
+    frames = run_sync([chunk['entity']], **{
+        **kwargs,
+        'fecha_inicio': chunk['start_date'],
+        'fecha_fin': chunk['end_date'],
+        'chunk_days': (end_date - start_date).days + 1,
+        'failed_chunks_path': None,
+        'time_budget_seconds': None,
+        'checkpoint_path': None,
+        'fail_on_chunk_errors': True,
+        'qb_realms': [chunk['realm']] if 'realm' in chunk else None,
+        # un archivo de métricas por chunk: los hijos corren al mismo tiempo
+        'metrics_run_id': f"{datetime.utcnow():%Y%m%dT%H%M%SZ}_{chunk['start_date']}",
+    })
+    df = frames[chunk['entity']]
+
+    realm = f"{chunk['realm']} " if 'realm' in chunk else ''
+    print(f"{realm}{chunk['entity']} {chunk['start_date']} a {chunk['end_date']}: {len(df)} filas")
+    return df.assign(entity=chunk['entity']) if not df.empty else df
+
+
+@test
+def test_output(output, *args) -> None:
+    """
+    Template code for testing the output of the block.
+    """
+    assert output is not None, 'The output is undefined'
@@ -1,5 +1,9 @@
-from pandas import DataFrame
-import math
+from mage_ai.settings.repo import get_repo_path
+from pandas import DataFrame, Series
+from pandas.api import types as ptypes
+from os import path
+import json
+import os
 
 if 'transformer' not in globals():
     from mage_ai.data_preparation.decorators import transformer
@@ -10,14 +14,86 @@ def select_number_columns(df: DataFrame) -> DataFrame:
     return df[['Age', 'Fare', 'Parch', 'Pclass', 'SibSp', 'Survived']]
 
 
-def fill_missing_values_with_median(df: DataFrame) -> DataFrame:
-    for col in df.columns:
-        values = sorted(df[col].dropna().tolist())
-        median_value = values[math.floor(len(values) / 2)]
-        df[[col]] = df[[col]].fillna(median_value)
+def integer_columns(df: DataFrame) -> list:
+    """
+    Columns holding whole numbers, including int columns read as float because
+    of nulls (e.g. Parch, Survived).
+    """
+    numbers = df.select_dtypes('number')
+    return [
+        col for col in numbers.columns
+        if ptypes.is_integer_dtype(numbers[col].dtype)
+        or (numbers[col].dropna() % 1 == 0).all()
+    ]
+
+
+def fit_medians(df: DataFrame, group_by: str = None) -> dict:
+    """
+    Computes every column median in one reduction and, when `group_by` is set,
+    the per-group medians in one grouped reduction.
+    """
+    stats = {
+        'group_by': group_by,
+        'medians': df.median(numeric_only=True).to_dict(),
+        'group_medians': [],
+    }
+    if group_by:
+        group_medians = df.groupby(group_by).median(numeric_only=True)
+        stats['group_medians'] = group_medians.reset_index().to_dict('records')
+    return stats
+
+
+def fill_missing_values_with_median(df: DataFrame, stats: dict) -> DataFrame:
+    """
+    Fills nulls with the fitted group medians first, then the global medians
+    for rows whose group is unknown or has no median.
+
+    Columns whose observed values in this batch are all whole numbers get
+    rounded medians and come back as int64 once nothing is missing (the
+    columnar export expects it). Observed values are never changed.
+    """
+    group_by = stats.get('group_by')
+    integers = [col for col in integer_columns(df) if col != group_by]
+    if group_by and stats.get('group_medians'):
+        group_medians = DataFrame.from_records(stats['group_medians']).set_index(group_by)
+        group_medians = group_medians.drop(columns=[group_by], errors='ignore')
+        rounded = group_medians.columns.intersection(integers)
+        group_medians[rounded] = group_medians[rounded].round()
+        row_medians = group_medians.reindex(df[group_by].to_numpy())
+        row_medians.index = df.index
+        df = df.fillna(row_medians)
+    medians = Series(stats['medians'], dtype='float64')
+    rounded = medians.index.intersection(integers)
+    medians[rounded] = medians[rounded].round()
+    df = df.fillna(medians.to_dict())
+
+    for col in integers:
+        if df[col].notna().all():
+            df[col] = df[col].astype('int64')
     return df
 
 
+def load_or_fit_medians(df: DataFrame, stats_path: str, group_by: str = None, refit: bool = False) -> dict:
+    """
+    Reuses the medians saved at `stats_path` when they were fitted with the same
+    grouping; otherwise fits them on `df` and saves them for later batches.
+    Fits saved with rounded medians (they carry 'integer_columns') are refitted.
+    """
+    if not refit and path.exists(stats_path):
+        with open(stats_path) as f:
+            stats = json.load(f)
+        if stats.get('group_by') == group_by and 'integer_columns' not in stats:
+            print(f'Using fitted medians from {stats_path}')
+            return stats
+
+    stats = fit_medians(df, group_by)
+    os.makedirs(path.dirname(stats_path) or '.', exist_ok=True)
+    with open(stats_path, 'w') as f:
+        json.dump(stats, f, indent=2, default=float)
+    print(f'Fitted medians saved to {stats_path}')
+    return stats
+
+
 @transformer
 def transform_df(df: DataFrame, *args, **kwargs) -> DataFrame:
     """
@@ -28,13 +104,23 @@ def transform_df(df: DataFrame, *args, **kwargs) -> DataFrame:
 
     Args:
         df (DataFrame): Data frame from parent block.
+        median_group_by (str): optional column to impute by group, e.g. 'Pclass'
+        median_stats_path (str): where fitted medians are kept
+            (default: <repo>/titanic_median_stats.json)
+        refit_medians (bool): recompute medians even if a saved fit exists
 
     Returns:
         DataFrame: Transformed data frame
     """
-    # Specify your transformation logic here
+    numbers = select_number_columns(df)
+    stats = load_or_fit_medians(
+        numbers,
+        kwargs.get('median_stats_path') or path.join(get_repo_path(), 'titanic_median_stats.json'),
+        group_by=kwargs.get('median_group_by'),
+        refit=kwargs.get('refit_medians', False),
+    )
 
-    return fill_missing_values_with_median(select_number_columns(df))
+    return fill_missing_values_with_median(numbers, stats)
 
 
 @test
@@ -0,0 +1,170 @@
+from collections.abc import Iterable
+from pandas import DataFrame
+import numpy as np
+
+if 'transformer' not in globals():
+    from mage_ai.data_preparation.decorators import transformer
+if 'test' not in globals():
+    from mage_ai.data_preparation.decorators import test
+
+
+OPERATIONS = ('diff', 'lag', 'pct_change', 'rolling_sum', 'rolling_mean')
+
+
+def _as_list(value) -> list:
+    """
+    Normalizes a kwarg that may be a single value (e.g. 'TxnDate' or 3) or a
+    list of them.
+    """
+    if value is None:
+        return []
+    if isinstance(value, (str, bytes)) or not isinstance(value, Iterable):
+        return [value]
+    return list(value)
+
+
+def _sort_order(df: DataFrame, group_by: list, order_by: list):
+    """
+    Returns the row permutation that sorts by group, then by `order_by`, plus
+    each sorted row's position inside its group.
+    """
+    n = len(df)
+    if group_by:
+        group_codes = df.groupby(group_by, sort=False, dropna=False).ngroup().to_numpy()
+    else:
+        group_codes = np.zeros(n, dtype=np.int64)
+
+    # np.lexsort sorts by the last key first and is stable.
+    sort_keys = [df[col].to_numpy() for col in reversed(order_by)] + [group_codes]
+    order = np.lexsort(sort_keys)
+
+    sorted_groups = group_codes[order]
+    positions = np.arange(n)
+    is_group_start = np.ones(n, dtype=bool)
+    is_group_start[1:] = sorted_groups[1:] != sorted_groups[:-1]
+    group_start = np.maximum.accumulate(np.where(is_group_start, positions, 0))
+    return order, positions - group_start
+
+
+def _lag(values: np.ndarray, position_in_group: np.ndarray, periods: int) -> np.ndarray:
+    lagged = np.full(len(values), np.nan)
+    lagged[periods:] = values[:-periods]
+    lagged[position_in_group < periods] = np.nan
+    return lagged
+
+
+def _rolling(values: np.ndarray, position_in_group: np.ndarray, window: int):
+    """
+    Window sums from prefix sums, so every group's window is computed in the
+    same vectorized pass. Like pandas' rolling(window), a row gets NaN unless
+    its group has `window` non-null values ending at that row.
+    """
+    present = ~np.isnan(values)
+    prefix_sum = np.concatenate(([0.0], np.cumsum(np.where(present, values, 0.0))))
+    prefix_count = np.concatenate(([0], np.cumsum(present)))
+
+    end = np.arange(1, len(values) + 1)
+    start = np.maximum(end - window, 0)
+    sums = prefix_sum[end] - prefix_sum[start]
+    counts = prefix_count[end] - prefix_count[start]
+
+    sums[(position_in_group < window - 1) | (counts < window)] = np.nan
+    return sums
+
+
+def compute_window_features(
+    df: DataFrame,
+    value_columns: list,
+    group_by: list = None,
+    order_by: list = None,
+    operations: list = ('diff',),
+    periods: list = (1,),
+    windows: list = (),
+) -> DataFrame:
+    """
+    Adds diff/lag/pct_change columns for each of `periods` and rolling sum/mean
+    columns for each of `windows`, computed within `group_by` groups in
+    `order_by` order. One sort, then NumPy array operations; no per-group loop.
+
+    New columns are named <column>_<operation>_<periods or window>. pct_change
+    is NaN where the previous value is 0.
+    """
+    unknown = set(operations) - set(OPERATIONS)
+    if unknown:
+        raise ValueError(f'Unknown operations {sorted(unknown)}; expected a subset of {OPERATIONS}')
+    if any(k < 1 for k in periods) or any(w < 1 for w in windows):
+        raise ValueError('periods and windows must be positive')
+
+    order, position_in_group = _sort_order(df, _as_list(group_by), _as_list(order_by))
+    features = {}
+
+    def unsort(sorted_values: np.ndarray) -> np.ndarray:
+        result = np.empty_like(sorted_values)
+        result[order] = sorted_values
+        return result
+
+    for col in value_columns:
+        values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)[order]
+
+        for k in periods:
+            lagged = _lag(values, position_in_group, k)
+            if 'lag' in operations:
+                features[f'{col}_lag_{k}'] = unsort(lagged)
+            if 'diff' in operations or 'pct_change' in operations:
+                diff = values - lagged
+                if 'diff' in operations:
+                    features[f'{col}_diff_{k}'] = unsort(diff)
+                if 'pct_change' in operations:
+                    pct = np.full(len(values), np.nan)
+                    np.divide(diff, lagged, out=pct, where=lagged != 0)
+                    features[f'{col}_pct_change_{k}'] = unsort(pct)
+
+        for w in windows:
+            sums = _rolling(values, position_in_group, w)
+            if 'rolling_sum' in operations:
+                features[f'{col}_rolling_sum_{w}'] = unsort(sums)
+            if 'rolling_mean' in operations:
+                features[f'{col}_rolling_mean_{w}'] = unsort(sums / w)
+
+    return df.assign(**features)
+
+
+@transformer
+def transform(df: DataFrame, *args, **kwargs) -> DataFrame:
+    """
+    Grouped diffs, lags, percent change and rolling windows over several columns,
+    e.g. per-customer invoice deltas or per-zone taxi deltas.
+
+    Args:
+        value_columns (str | list): numeric columns to derive features from (required)
+        group_by (str | list): keys that partition the rows, e.g. 'customer_id'
+        order_by (str | list): keys that order rows inside each group, e.g. 'TxnDate'
+        operations (str | list): any of diff, lag, pct_change, rolling_sum,
+            rolling_mean (default: ['diff'])
+        periods (int | list): lag distances for diff/lag/pct_change (default: [1])
+        windows (int | list): window sizes in rows for the rolling operations
+
+    Returns:
+        DataFrame: Input frame plus one column per column/operation/size
+    """
+    value_columns = _as_list(kwargs.get('value_columns'))
+    if not value_columns:
+        raise ValueError("'value_columns' is required")
+
+    return compute_window_features(
+        df,
+        value_columns,
+        group_by=kwargs.get('group_by'),
+        order_by=kwargs.get('order_by'),
+        operations=_as_list(kwargs.get('operations', ['diff'])),
+        periods=[int(k) for k in _as_list(kwargs.get('periods', [1]))],
+        windows=[int(w) for w in _as_list(kwargs.get('windows', []))],
+    )
+
+
+@test
+def test_output(output, *args) -> None:
+    """
+    Template code for testing the output of the block.
+    """
+    assert output is not None, 'The output is undefined'
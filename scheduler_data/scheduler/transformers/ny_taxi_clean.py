@@ -1,4 +1,5 @@
-from pandas import DataFrame, to_datetime
+from pandas import DataFrame, to_datetime, to_numeric
+import numpy as np
 
 if 'transformer' not in globals():
     from mage_ai.data_preparation.decorators import transformer
@@ -6,6 +7,64 @@ if 'test' not in globals():
     from mage_ai.data_preparation.decorators import test
 
 
+# Reason codes, combined as bit flags in `invalid_reason`.
+INVALID_PICKUP_DATETIME = 1
+INVALID_DROPOFF_DATETIME = 2
+INVALID_NUMBER = 4
+NEGATIVE_FARE = 8
+NEGATIVE_DISTANCE = 16
+DROPOFF_BEFORE_PICKUP = 32
+INVALID_PU_LOCATION = 64
+INVALID_DO_LOCATION = 128
+
+DATETIME_COLUMNS = {
+    'tpep_pickup_datetime': INVALID_PICKUP_DATETIME,
+    'tpep_dropoff_datetime': INVALID_DROPOFF_DATETIME,
+}
+NUMERIC_COLUMNS = ['trip_distance', 'fare_amount', 'total_amount', 'PULocationID', 'DOLocationID']
+LOCATION_COLUMNS = {
+    'PULocationID': INVALID_PU_LOCATION,
+    'DOLocationID': INVALID_DO_LOCATION,
+}
+# TLC taxi zone ids (taxi_zone_lookup.csv), 264/265 being the "Unknown" zones.
+LOCATION_ID_RANGE = (1, 265)
+
+
+def coerce_columns(df: DataFrame, reasons: np.ndarray) -> None:
+    """
+    Parses timestamp and numeric columns in place; unparseable values become
+    NaT/NaN and flag the row instead of failing the block.
+    """
+    for col, flag in DATETIME_COLUMNS.items():
+        parsed = to_datetime(df[col], errors='coerce')
+        reasons[(parsed.isna() & df[col].notna()).to_numpy()] |= flag
+        df[col] = parsed
+
+    for col in NUMERIC_COLUMNS:
+        if df[col].dtype.kind in 'iuf':
+            continue
+        parsed = to_numeric(df[col], errors='coerce')
+        reasons[(parsed.isna() & df[col].notna()).to_numpy()] |= INVALID_NUMBER
+        df[col] = parsed
+
+
+def validate(df: DataFrame, reasons: np.ndarray) -> None:
+    """
+    Applies the range checks column-wise over the whole frame.
+    """
+    reasons[df['fare_amount'].to_numpy() < 0] |= NEGATIVE_FARE
+    reasons[df['trip_distance'].to_numpy() < 0] |= NEGATIVE_DISTANCE
+
+    pickup = df['tpep_pickup_datetime'].to_numpy()
+    dropoff = df['tpep_dropoff_datetime'].to_numpy()
+    reasons[dropoff < pickup] |= DROPOFF_BEFORE_PICKUP
+
+    low, high = LOCATION_ID_RANGE
+    for col, flag in LOCATION_COLUMNS.items():
+        values = df[col].to_numpy(dtype='float64', na_value=np.nan)
+        reasons[~((values >= low) & (values <= high))] |= flag
+
+
 @transformer
 def execute_transformer_action(df: DataFrame, *args, **kwargs) -> DataFrame:
     """
@@ -14,10 +73,21 @@ def execute_transformer_action(df: DataFrame, *args, **kwargs) -> DataFrame:
     This marks any improperly formatted values in each column specified
     as invalid.
 
+    Bad timestamps and numbers are coerced to NaT/NaN, and every row gets an
+    `is_valid` flag plus an `invalid_reason` bitmask (see the reason codes at the
+    top of this file). Invalid rows are kept so downstream blocks can decide.
+
     Docs: https://docs.mage.ai/guides/transformer-blocks#fix-syntax-errors
     """
-    df.tpep_pickup_datetime = to_datetime(df.tpep_pickup_datetime)
-    df.tpep_dropoff_datetime = to_datetime(df.tpep_dropoff_datetime)
+    reasons = np.zeros(len(df), dtype=np.uint8)
+
+    coerce_columns(df, reasons)
+    validate(df, reasons)
+
+    df['invalid_reason'] = reasons
+    df['is_valid'] = reasons == 0
+
+    print(f'{int((reasons != 0).sum())} of {len(df)} rows marked as invalid')
 
     return df
 
@@ -28,3 +98,4 @@ def test_output(output, *args) -> None:
     Template code for testing the output of the block.
     """
     assert output is not None, 'The output is undefined'
+    assert 'is_valid' in output.columns, 'Validity mask is missing'
@@ -0,0 +1,115 @@
+from pandas import DataFrame
+from pandas.arrays import IntegerArray
+import numpy as np
+
+if 'transformer' not in globals():
+    from mage_ai.data_preparation.decorators import transformer
+if 'test' not in globals():
+    from mage_ai.data_preparation.decorators import test
+
+
+SECONDS_PER_HOUR = 3600
+SECONDS_PER_DAY = 86400
+# 1970-01-01 was a Thursday (Monday == 0).
+EPOCH_WEEKDAY = 3
+
+
+def _epoch_seconds(values: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """
+    Writes datetime64 values as float seconds since epoch into `out`, reading
+    the underlying int64 buffer without converting units first.
+    """
+    unit, count = np.datetime_data(values.dtype)
+    scale = np.timedelta64(count, unit) / np.timedelta64(1, 's')
+    np.multiply(values.view('i8'), scale, out=out)
+    return out
+
+
+def compute_trip_metrics(df: DataFrame) -> DataFrame:
+    """
+    Adds trip_duration_min, avg_speed_mph, tip_pct, pickup_hour and
+    pickup_weekday in a single pass over the NumPy buffers.
+
+    Scratch space is two float64 arrays reused across metrics; results are
+    written straight into float32/UInt8 outputs. Rows with a missing timestamp,
+    zero duration or zero fare get NaN/NA for the affected metrics.
+    """
+    n = len(df)
+    pickup = df['tpep_pickup_datetime'].to_numpy()
+    dropoff = df['tpep_dropoff_datetime'].to_numpy()
+    missing_time = np.isnat(pickup)
+    missing_time |= np.isnat(dropoff)
+
+    pickup_s = _epoch_seconds(pickup, np.empty(n, dtype=np.float64))
+    scratch = _epoch_seconds(dropoff, np.empty(n, dtype=np.float64))
+    np.subtract(scratch, pickup_s, out=scratch)  # duration in seconds
+    scratch[missing_time] = np.nan
+
+    duration_min = np.empty(n, dtype=np.float32)
+    np.divide(scratch, 60, out=duration_min, casting='same_kind')
+
+    avg_speed = np.full(n, np.nan, dtype=np.float32)
+    moving = scratch > 0
+    np.divide(scratch, SECONDS_PER_HOUR, out=scratch)  # duration in hours
+    np.divide(
+        df['trip_distance'].to_numpy(dtype=np.float64),
+        scratch,
+        out=avg_speed,
+        where=moving,
+        casting='same_kind',
+    )
+
+    tip_pct = np.full(n, np.nan, dtype=np.float32)
+    fare = df['fare_amount'].to_numpy(dtype=np.float64)
+    np.divide(
+        df['tip_amount'].to_numpy(dtype=np.float64),
+        fare,
+        out=tip_pct,
+        where=fare > 0,
+        casting='same_kind',
+    )
+    np.multiply(tip_pct, 100, out=tip_pct)
+
+    # Hour and weekday from whole seconds since epoch, reusing `scratch`.
+    no_pickup = np.isnat(pickup)
+    pickup_s[no_pickup] = 0
+    np.floor_divide(pickup_s, SECONDS_PER_HOUR, out=scratch)
+    pickup_hour = np.empty(n, dtype=np.uint8)
+    np.mod(scratch, 24, out=pickup_hour, casting='unsafe')
+    np.floor_divide(pickup_s, SECONDS_PER_DAY, out=scratch)
+    np.add(scratch, EPOCH_WEEKDAY, out=scratch)
+    pickup_weekday = np.empty(n, dtype=np.uint8)
+    np.mod(scratch, 7, out=pickup_weekday, casting='unsafe')
+
+    df['trip_duration_min'] = duration_min
+    df['avg_speed_mph'] = avg_speed
+    df['tip_pct'] = tip_pct
+    df['pickup_hour'] = IntegerArray(pickup_hour, no_pickup)
+    df['pickup_weekday'] = IntegerArray(pickup_weekday, no_pickup)
+
+    return df
+
+
+@transformer
+def transform(df: DataFrame, *args, **kwargs) -> DataFrame:
+    """
+    Precomputes per-trip metrics after `ny_taxi_clean` so dashboards don't
+    derive them in SQL on every query.
+
+    Args:
+        df (DataFrame): Data frame from ny_taxi_clean.
+
+    Returns:
+        DataFrame: Input frame with trip_duration_min, avg_speed_mph, tip_pct,
+        pickup_hour and pickup_weekday columns.
+    """
+    return compute_trip_metrics(df)
+
+
+@test
+def test_output(output, *args) -> None:
+    """
+    Template code for testing the output of the block.
+    """
+    assert output is not None, 'The output is undefined'
+    assert output['pickup_hour'].dropna().between(0, 23).all(), 'pickup_hour out of range'
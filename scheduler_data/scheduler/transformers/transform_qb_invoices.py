@@ -1,5 +1,5 @@
-import pandas as pd
-import json
+from scheduler.utils.profiling import profile_block, profile_phase
+from scheduler.utils.qb_frames import PageFrameBuilder
 
 if 'transformer' not in globals():
     from mage_ai.data_preparation.decorators import transformer
@@ -7,64 +7,53 @@ if 'test' not in globals():
     from mage_ai.data_preparation.decorators import test
 
 
+def _records_key(page_metadata, records_key=None):
+    """
+    Clave de la lista de registros en la página ('invoices', 'customers', ...).
+    Si no se indica, se toma la primera lista que no sea metadato.
+    """
+    if records_key:
+        return records_key
+    for key, value in page_metadata.items():
+        if isinstance(value, list):
+            return key
+    return None
+
+
 @transformer
+@profile_block('transform_qb_invoices')
 def transform(data, *args, **kwargs):
     """
-    Transforma all_pages_metadata a un DataFrame donde cada fila es un invoice individual.
+    Transforma all_pages_metadata a un DataFrame donde cada fila es un registro individual.
 
     Args:
         data: all_pages_metadata del script de ingesta
+        records_key (str): clave de los registros en cada página (opcional,
+            default: la primera lista de la página, p. ej. 'invoices')
 
     Returns:
-        pandas.DataFrame: DataFrame con una fila por invoice
+        pandas.DataFrame: DataFrame con una fila por registro
     """
-    # Lista para almacenar todas las filas del DataFrame
-    rows = []
-    
-    # Procesar cada página
+    records_key = kwargs.get('records_key')
+    builder = PageFrameBuilder()
+
+    # Procesar cada página: ids y payloads por registro, metadatos una vez por página
     for page_metadata in data:
-        # Extraer metadatos comunes de la página
-        page_common_data = {
-            'ingested_at_utc': page_metadata.get('ingested_at_utc'),
-            'extract_window_start_utc': page_metadata.get('extract_window_start_utc'),
-            'extract_window_end_utc': page_metadata.get('extract_window_end_utc'),
-            'page_number': page_metadata.get('page_number'),
-            'page_size': page_metadata.get('page_size'),
-            'request_payload': json.dumps(page_metadata.get('request_payload', {}))
-        }
-        
-        # Procesar cada invoice en la página
-        invoices = page_metadata.get('invoices', [])
-        
-        for invoice in invoices:
-            # Crear fila para este invoice
-            row = {
-                'id': invoice.get('Id'),  # ID del invoice
-                'payload': json.dumps(invoice),  # Payload completo del invoice como JSON
-                **page_common_data  # Agregar metadatos comunes de la página
-            }
-            
-            rows.append(row)
-    
-    # Crear DataFrame
-    df = pd.DataFrame(rows)
-    
-    # Reordenar columnas en el orden deseado
-    column_order = [
-        'id',
-        'payload', 
-        'ingested_at_utc',
-        'extract_window_start_utc',
-        'extract_window_end_utc',
-        'page_number',
-        'page_size',
-        'request_payload'
-    ]
-    
-    df = df[column_order]
-    
-    print(f"DataFrame creado con {len(df)} invoices de {len(data)} páginas")
-    
+        key = _records_key(page_metadata, records_key)
+        builder.add_page(
+            page_metadata.get(key, []) if key else [],
+            ingested_at_utc=page_metadata.get('ingested_at_utc'),
+            extract_window_start_utc=page_metadata.get('extract_window_start_utc'),
+            extract_window_end_utc=page_metadata.get('extract_window_end_utc'),
+            page_number=page_metadata.get('page_number'),
+            request_payload=page_metadata.get('request_payload', {}),
+        )
+
+    with profile_phase('frame_build'):
+        df = builder.build()
+
+    print(f"DataFrame creado con {len(df)} registros de {len(data)} páginas")
+
     return df
 
 
@@ -0,0 +1,261 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+
+class AIMDController:
+    """
+    Additive-increase / multiplicative-decrease limit on in-flight requests.
+
+    Every `slot()` holds one of `limit` concurrent request slots. Once a full
+    window of requests (as many as the current limit) succeeds with latency
+    within `latency_tolerance` times the best latency seen, the limit grows by
+    `additive_increase`. A 429 or timeout multiplies it by
+    `multiplicative_decrease`, at most once per `cooldown_seconds` so a burst of
+    throttled responses from the same window counts as one signal. A 429 also
+    pauses every slot until its Retry-After has passed, instead of only the
+    thread that received it.
+
+    Thread-safe; share one controller per rate-limited dependency (see
+    `get_controller`).
+    """
+
+    def __init__(self, name, initial_limit=2, min_limit=1, max_limit=8, additive_increase=1.0,
+                 multiplicative_decrease=0.5, latency_tolerance=2.0, cooldown_seconds=5.0):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.additive_increase = additive_increase
+        self.multiplicative_decrease = multiplicative_decrease
+        self.latency_tolerance = latency_tolerance
+        self.cooldown_seconds = cooldown_seconds
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._window_successes = 0
+        self._window_healthy = True
+        self._best_latency = None
+        self._stats = {'increases': 0, 'decreases': 0, 'throttles': 0, 'timeouts': 0, 'max_in_flight': 0}
+
+    @property
+    def limit(self):
+        with self._cond:
+            return int(self._limit)
+
+    @contextmanager
+    def slot(self):
+        """
+        Blocks until a request slot is free and no Retry-After pause is active.
+        """
+        with self._cond:
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                elif self._in_flight >= int(self._limit):
+                    self._cond.wait()
+                else:
+                    break
+            self._in_flight += 1
+            self._stats['max_in_flight'] = max(self._stats['max_in_flight'], self._in_flight)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def on_success(self, latency):
+        with self._cond:
+            if self._best_latency is None or latency < self._best_latency:
+                self._best_latency = latency
+            if latency > self._best_latency * self.latency_tolerance:
+                self._window_healthy = False
+            self._window_successes += 1
+            if self._window_successes >= int(self._limit):
+                if self._window_healthy and self._limit < self.max_limit:
+                    self._limit = min(self.max_limit, self._limit + self.additive_increase)
+                    self._stats['increases'] += 1
+                    self._cond.notify_all()
+                self._window_successes = 0
+                self._window_healthy = True
+
+    def on_throttle(self, retry_after=None):
+        with self._cond:
+            self._stats['throttles'] += 1
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._decrease()
+
+    def on_timeout(self):
+        with self._cond:
+            self._stats['timeouts'] += 1
+            self._decrease()
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown_seconds:
+            return
+        self._last_decrease = now
+        self._limit = max(self.min_limit, self._limit * self.multiplicative_decrease)
+        self._window_successes = 0
+        self._window_healthy = True
+        self._stats['decreases'] += 1
+
+    def configure(self, initial_limit=None, **config):
+        """
+        Applies new bounds or tuning (same keywords as the constructor) to a
+        controller that already exists, keeping the limit it has learned but
+        clamped to the new `min_limit`/`max_limit`. `initial_limit` only
+        matters on creation and is ignored here.
+        """
+        with self._cond:
+            for key, value in config.items():
+                if not hasattr(self, key) or key.startswith('_'):
+                    raise TypeError(f'Unknown controller setting {key!r}')
+                setattr(self, key, value)
+            self._limit = float(min(max(self._limit, self.min_limit), self.max_limit))
+            self._cond.notify_all()
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                'name': self.name,
+                'limit': round(self._limit, 2),
+                'in_flight': self._in_flight,
+                'best_latency_seconds': round(self._best_latency, 4) if self._best_latency else None,
+                **self._stats,
+            }
+
+
+class AsyncAIMDController(AIMDController):
+    """
+    AIMDController for asyncio tasks: `slot()` is an async context manager that
+    suspends the task instead of blocking the event loop's thread. Limits,
+    signals and snapshot are the same as the threaded controller.
+
+    The waiting tasks park on an asyncio.Condition of the running loop; a new
+    loop (e.g. the next `asyncio.run`) gets a new one, so the controller and
+    its learned limit can outlive a single loop.
+    """
+
+    def __init__(self, name, **config):
+        super().__init__(name, **config)
+        self._loop = None
+        self._waiters = None
+
+    def _condition(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._waiters = asyncio.Condition()
+        return self._waiters
+
+    def _acquire(self):
+        """
+        Takes a slot if one is free; otherwise returns how long to wait
+        (None: until a slot is released).
+        """
+        with self._cond:
+            wait = self._paused_until - time.monotonic()
+            if wait > 0:
+                return wait
+            if self._in_flight >= int(self._limit):
+                return None
+            self._in_flight += 1
+            self._stats['max_in_flight'] = max(self._stats['max_in_flight'], self._in_flight)
+            return 0
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Waits until a request slot is free and no Retry-After pause is active.
+        """
+        waiters = self._condition()
+        async with waiters:
+            while True:
+                wait = self._acquire()
+                if wait == 0:
+                    break
+                try:
+                    await asyncio.wait_for(waiters.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+            async with waiters:
+                waiters.notify_all()
+
+
+_registry = {}
+_async_registry = {}
+_registry_lock = threading.Lock()
+
+
+def get_controller(name, **config):
+    """
+    Process-wide controller for `name` (e.g. 'quickbooks:<realm_id>'). The limit
+    it learns carries over to later runs in the same process; on later lookups
+    `config` is re-applied through `configure`, so a lowered `max_limit` takes
+    effect at once.
+    """
+    with _registry_lock:
+        controller = _registry.get(name)
+        if controller is None:
+            controller = _registry[name] = AIMDController(name, **config)
+        elif config:
+            controller.configure(**config)
+        return controller
+
+
+def get_async_controller(name, **config):
+    """
+    Like `get_controller`, for the asyncio client. Kept apart from the threaded
+    controllers since a task cannot wait on a thread's condition.
+    """
+    with _registry_lock:
+        controller = _async_registry.get(name)
+        if controller is None:
+            controller = _async_registry[name] = AsyncAIMDController(name, **config)
+        elif config:
+            controller.configure(**config)
+        return controller
+
+
+def reset_controllers():
+    with _registry_lock:
+        _registry.clear()
+        _async_registry.clear()
+
+
+def load_limits(state_path):
+    """
+    Limits saved by `save_limits`, as {name: limit}; empty if there is no file.
+    """
+    try:
+        with open(state_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_limits(state_path, controllers):
+    """
+    Persists the learned limit of each controller so the next process starts
+    from it instead of `initial_limit`.
+    """
+    limits = load_limits(state_path)
+    limits.update({controller.name: controller.limit for controller in controllers})
+    os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(limits, f, indent=2)
+    os.replace(tmp_path, state_path)
@@ -0,0 +1,147 @@
+import threading
+import time
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a dependency whose circuit is open. `retry_after`
+    says how many seconds remain until the breaker lets a probe through, so the
+    caller can work on something else rather than sleep.
+    """
+
+    def __init__(self, name, retry_after):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"Circuit '{name}' is open; retry in {retry_after:.0f}s")
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker with half-open probing.
+
+    closed: calls go through; `failure_threshold` consecutive failures open it.
+    open: calls fail fast with CircuitOpenError until `recovery_timeout` passes.
+    half_open: up to `half_open_max_calls` probes go through; a success closes
+        the circuit, a failure opens it again with the timeout doubled (capped
+        at `max_recovery_timeout`).
+
+    Usage:
+        breaker.before_call()      # raises CircuitOpenError when open
+        try:
+            result = call()
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+    """
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=60, max_recovery_timeout=300,
+                 half_open_max_calls=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.max_recovery_timeout = max_recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._current_timeout = recovery_timeout
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._times_opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def retry_after(self):
+        with self._lock:
+            return self._retry_after()
+
+    def _retry_after(self):
+        if self._state != OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self._current_timeout - time.monotonic())
+
+    def before_call(self):
+        """
+        Admits the call or raises CircuitOpenError. Moves open -> half_open once
+        the recovery timeout has passed.
+        """
+        with self._lock:
+            if self._state == OPEN:
+                if self._retry_after() > 0:
+                    raise CircuitOpenError(self.name, self._retry_after())
+                self._state = HALF_OPEN
+                self._half_open_calls = 0
+            if self._state == HALF_OPEN:
+                if self._half_open_calls >= self.half_open_max_calls:
+                    # another caller is already probing; fail fast until it reports back
+                    raise CircuitOpenError(self.name, 1.0)
+                self._half_open_calls += 1
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._consecutive_failures = 0
+            self._current_timeout = self.recovery_timeout
+            self._half_open_calls = 0
+
+    def record_failure(self):
+        """
+        Counts a failure. Returns True when this failure opened the circuit.
+        """
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN:
+                self._current_timeout = min(self._current_timeout * 2, self.max_recovery_timeout)
+                self._open()
+                return True
+            if self._state == CLOSED and self._consecutive_failures >= self.failure_threshold:
+                self._open()
+                return True
+            return False
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._half_open_calls = 0
+        self._times_opened += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'name': self.name,
+                'state': self._state,
+                'consecutive_failures': self._consecutive_failures,
+                'retry_after': round(self._retry_after(), 1),
+                'times_opened': self._times_opened,
+            }
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name, **config):
+    """
+    Process-wide breaker for `name` (e.g. 'quickbooks:<realm_id>'), so every
+    block and worker thread talking to the same dependency shares one state.
+    `config` only applies when the breaker is first created.
+    """
+    with _registry_lock:
+        breaker = _registry.get(name)
+        if breaker is None:
+            breaker = _registry[name] = CircuitBreaker(name, **config)
+        return breaker
+
+
+def reset_breakers():
+    with _registry_lock:
+        _registry.clear()
@@ -0,0 +1,100 @@
+import io
+
+from pandas import DataFrame
+
+
+def quote_ident(name: str) -> str:
+    """
+    Quotes a Postgres identifier, keeping mixed-case names like "VendorID".
+    """
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def qualified_name(schema_name: str, table_name: str) -> str:
+    return f'{quote_ident(schema_name)}.{quote_ident(table_name)}'
+
+
+def copy_frame(cursor, df: DataFrame, target: str, columns=None, chunk_rows: int = 500_000) -> int:
+    """
+    Streams a DataFrame into `target` with COPY ... FROM STDIN (CSV).
+
+    The frame is serialized in slices of `chunk_rows` so only one slice is held
+    as text at a time. NaN/None (and empty strings) become NULL. The caller owns
+    the transaction.
+
+    Args:
+        cursor: psycopg2 cursor
+        df (DataFrame): rows to load
+        target (str): already-quoted table name (see `qualified_name`)
+        columns (list): columns to send, in table order (default: all)
+        chunk_rows (int): rows serialized per COPY statement
+
+    Returns:
+        int: number of rows sent
+    """
+    columns = list(columns if columns is not None else df.columns)
+    column_list = ', '.join(quote_ident(col) for col in columns)
+    copy_sql = f"COPY {target} ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '')"
+
+    for start in range(0, len(df), chunk_rows):
+        buffer = io.StringIO()
+        df.iloc[start:start + chunk_rows].to_csv(
+            buffer,
+            columns=columns,
+            index=False,
+            header=False,
+            date_format='%Y-%m-%d %H:%M:%S.%f',
+        )
+        buffer.seek(0)
+        cursor.copy_expert(copy_sql, buffer)
+
+    return len(df)
+
+
+_TEXT_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _encode_text_value(value) -> bytes:
+    """
+    Encodes one value for COPY text format. bytes are passed through untouched
+    apart from escaping, so pre-serialized JSON is never decoded again.
+    """
+    if value is None:
+        return b'\\N'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value)
+        if b'\\' in value or b'\t' in value or b'\n' in value or b'\r' in value:
+            value = (value.replace(b'\\', b'\\\\').replace(b'\t', b'\\t')
+                     .replace(b'\n', b'\\n').replace(b'\r', b'\\r'))
+        return value
+    if isinstance(value, float):
+        if value != value:
+            return b'\\N'
+        if value.is_integer():
+            # int columns with nulls arrive as float; '3' fits INTEGER and FLOAT alike
+            value = int(value)
+    return str(value).translate(_TEXT_ESCAPES).encode('utf-8')
+
+
+def copy_text_frame(cursor, df: DataFrame, target: str, columns=None, chunk_rows: int = 50_000) -> int:
+    """
+    Streams a DataFrame into `target` with COPY ... FROM STDIN in text format.
+
+    Unlike `copy_frame`, bytes columns (e.g. JSON payloads already serialized by
+    the loader) are written as-is, and empty strings stay distinct from NULL.
+    The caller owns the transaction.
+    """
+    columns = list(columns if columns is not None else df.columns)
+    column_list = ', '.join(quote_ident(col) for col in columns)
+    copy_sql = f'COPY {target} ({column_list}) FROM STDIN'
+
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        encoded = [
+            [_encode_text_value(value) for value in chunk[col].astype(object).where(chunk[col].notna(), None)]
+            for col in columns
+        ]
+        buffer = io.BytesIO(b''.join(b'\t'.join(row) + b'\n' for row in zip(*encoded)))
+        cursor.copy_expert(copy_sql, buffer)
+
+    return len(df)
@@ -0,0 +1,241 @@
+import functools
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+from mage_ai.settings.repo import get_repo_path
+
+
+_current_profiler = ContextVar('block_profiler', default=None)
+
+
+def _rss_mb():
+    """
+    Current resident set size of the process in MB (Linux /proc; None elsewhere).
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf('SC_PAGE_SIZE') / 1e6, 1)
+    except (OSError, ValueError):
+        return None
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KB on Linux; it is the peak of the whole process lifetime
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3, 1)
+
+
+class BlockProfiler:
+    """
+    Accumulates wall time, CPU time and memory per named phase of a block run.
+
+    A phase can be entered many times (e.g. 'fetch' once per page); its numbers
+    are summed and its memory peaks maxed. Phases may nest: the tracemalloc peak
+    of an inner phase also counts toward the outer one. Phases entered from
+    worker threads are summed too (so their wall time can exceed the block's);
+    tracemalloc peaks are process-wide and only approximate there.
+    """
+
+    def __init__(self, block_name, trace_memory=True, top_allocations=10):
+        self.block_name = block_name
+        self.trace_memory = trace_memory
+        self.top_allocations = top_allocations
+        self.phases = {}
+        self.allocation_sites = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def _peak_stack(self):
+        # nesting is per thread
+        if not hasattr(self._local, 'peak_stack'):
+            self._local.peak_stack = []
+        return self._local.peak_stack
+
+    @contextmanager
+    def phase(self, name):
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        peak_stack = self._peak_stack
+        if tracing:
+            # fold the peak so far into the enclosing phase before resetting it
+            _, peak = tracemalloc.get_traced_memory()
+            if peak_stack:
+                peak_stack[-1] = max(peak_stack[-1], peak)
+            tracemalloc.reset_peak()
+            peak_stack.append(0)
+
+        rss_start = _rss_mb()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            if tracing:
+                _, peak = tracemalloc.get_traced_memory()
+                peak = max(peak, peak_stack.pop())
+                if peak_stack:
+                    peak_stack[-1] = max(peak_stack[-1], peak)
+            self._record(name, wall, cpu, rss_start, peak if tracing else None)
+
+    def _record(self, name, wall, cpu, rss_start, peak):
+        with self._lock:
+            stats = self.phases.setdefault(name, {
+                'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                'rss_start_mb': rss_start, 'rss_end_mb': None, 'peak_rss_mb': None,
+                'tracemalloc_peak_mb': None,
+            })
+            stats['calls'] += 1
+            stats['wall_seconds'] += wall
+            stats['cpu_seconds'] += cpu
+            stats['rss_end_mb'] = _rss_mb()
+            stats['peak_rss_mb'] = _peak_rss_mb()
+            if peak is not None:
+                stats['tracemalloc_peak_mb'] = max(stats['tracemalloc_peak_mb'] or 0, round(peak / 1e6, 2))
+
+    def capture_allocation_sites(self):
+        """
+        Top source lines by memory still held (e.g. the frame the block returns).
+        """
+        if not (self.trace_memory and tracemalloc.is_tracing()):
+            return
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen *>'),
+        ))
+        self.allocation_sites = [
+            {'site': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}',
+             'size_mb': round(stat.size / 1e6, 3), 'count': stat.count}
+            for stat in snapshot.statistics('lineno')[:self.top_allocations]
+        ]
+
+    def report(self):
+        phases = {
+            name: {**stats, 'wall_seconds': round(stats['wall_seconds'], 4),
+                   'cpu_seconds': round(stats['cpu_seconds'], 4)}
+            for name, stats in self.phases.items()
+        }
+        return {
+            'block': self.block_name,
+            'profiled_at': datetime.utcnow().isoformat() + 'Z',
+            'peak_rss_mb': _peak_rss_mb(),
+            'phases': phases,
+            'top_allocation_sites': self.allocation_sites,
+        }
+
+    def summary(self):
+        """
+        Compact numbers for the block output: totals plus wall seconds per phase.
+        """
+        total = self.phases.get('total', {})
+        return {
+            'block': self.block_name,
+            'wall_seconds': round(total.get('wall_seconds', 0.0), 4),
+            'cpu_seconds': round(total.get('cpu_seconds', 0.0), 4),
+            'peak_rss_mb': _peak_rss_mb(),
+            'tracemalloc_peak_mb': total.get('tracemalloc_peak_mb'),
+            'phase_wall_seconds': {
+                name: round(stats['wall_seconds'], 4) for name, stats in self.phases.items() if name != 'total'
+            },
+        }
+
+    def write(self, output_dir):
+        """
+        Writes `<block>.json` (latest run) and appends the run to `<block>.jsonl`
+        so successive runs can be compared.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        report = self.report()
+        latest_path = os.path.join(output_dir, f'{self.block_name}.json')
+        with open(latest_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        with open(os.path.join(output_dir, f'{self.block_name}.jsonl'), 'a') as f:
+            f.write(json.dumps(report) + '\n')
+        return latest_path
+
+
+@contextmanager
+def profile_phase(name):
+    """
+    Times a phase of the block being profiled; a no-op outside `profile_block`.
+    """
+    profiler = _current_profiler.get()
+    if profiler is None:
+        yield
+        return
+    with profiler.phase(name):
+        yield
+
+
+def profile_block(block_name):
+    """
+    Decorator for Mage block functions. Runs the block inside a 'total' phase,
+    collects the `profile_phase` sections it enters and writes the profile next
+    to the pipeline's variables.
+
+    Apply it under Mage's decorator so Mage registers the wrapped function:
+
+        @data_loader
+        @profile_block('ingest_qb_invoices')
+        def load_data(*args, **kwargs): ...
+
+    Block kwargs:
+        profile (bool): disable profiling entirely (default: True)
+        profile_tracemalloc (bool): also trace Python allocations per phase and
+            the top allocation sites; adds noticeable overhead (default: False)
+        profile_dir (str): output folder
+            (default: <repo>/.variables/profiles/<pipeline_uuid>)
+
+    Mage writes its own resource_usage.json into the block output folder and
+    overwrites it on every run, so the full profile is kept in a separate file.
+    The summary travels with the block output instead: in `df.attrs['profile']`
+    when the block returns a DataFrame, and in the run's shared `context` dict
+    under context['profiles'][<block>] for the downstream blocks.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not kwargs.get('profile', True):
+                return function(*args, **kwargs)
+
+            profiler = BlockProfiler(block_name, trace_memory=kwargs.get('profile_tracemalloc', False))
+            started_tracing = profiler.trace_memory and not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            token = _current_profiler.set(profiler)
+            try:
+                with profiler.phase('total'):
+                    result = function(*args, **kwargs)
+                profiler.capture_allocation_sites()
+            finally:
+                _current_profiler.reset(token)
+                if started_tracing:
+                    tracemalloc.stop()
+
+            output_dir = kwargs.get('profile_dir') or os.path.join(
+                get_repo_path(), '.variables', 'profiles', kwargs.get('pipeline_uuid') or 'adhoc',
+            )
+            summary = profiler.summary()
+            try:
+                summary['profile_path'] = profiler.write(output_dir)
+                print(f"Profile of {block_name}: {summary['wall_seconds']:.2f}s wall, "
+                      f"{summary['cpu_seconds']:.2f}s CPU, peak RSS {summary['peak_rss_mb']} MB -> {summary['profile_path']}")
+            except OSError as e:
+                print(f'Could not write profile for {block_name}: {e}')
+
+            if isinstance(getattr(result, 'attrs', None), dict):
+                result.attrs['profile'] = summary
+            context = kwargs.get('context')
+            if isinstance(context, dict):
+                context.setdefault('profiles', {})[block_name] = summary
+            return result
+        return wrapper
+    return decorator
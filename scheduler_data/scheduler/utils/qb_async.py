@@ -0,0 +1,356 @@
+import asyncio
+import contextvars
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import httpx
+except ImportError:  # httpx es opcional; solo lo usa qb_client='async'
+    httpx = None
+
+from scheduler.utils.adaptive_concurrency import get_async_controller
+from scheduler.utils.circuit_breaker import CircuitOpenError, get_breaker
+from scheduler.utils.profiling import profile_phase
+from scheduler.utils.qb_sync import (
+    QB_BASE_URL, QB_MINOR_VERSION, QB_TOKEN_URL, REFRESH_TOKEN, RETRY_LATER, ChunkPages, EntitySync,
+    PageFetch, SpeculativeFetchError, _token_request,
+)
+
+
+# excepciones de httpx por tipo (ver qb_sync.REQUESTS_ERROR_KINDS)
+HTTPX_ERROR_KINDS = (
+    (httpx.TimeoutException, 'timeout'),
+    (httpx.TransportError, 'connection'),
+    (httpx.HTTPError, 'request'),
+    (json.JSONDecodeError, 'json'),
+) if httpx is not None else ()
+
+
+async def _refrescar_access_token(http, token_url=QB_TOKEN_URL, realm_name=None):
+
+    headers, data = _token_request(realm_name)
+
+    try:
+        print('Post para refrescar token')
+        response = await http.post(token_url, headers=headers, data=data, timeout=60)
+        response.raise_for_status()
+        token_data = response.json()
+        new_access_token = token_data.get('access_token')
+        new_refresh_token = token_data.get('refresh_token')
+
+        if new_access_token:
+            print('Exito al refrescar token')
+            return new_access_token, new_refresh_token
+        else:
+            raise ValueError("Error al solicitar nuevo token")
+
+    except httpx.HTTPError as e:
+        print(f'Error al refrescar token: {e}')
+        return None, None
+    except json.JSONDecodeError as e:
+        print(f'Error al decodificar respuesta JSON: {e}')
+        return None, None
+
+
+class AsyncQBClient:
+    """
+    Versión asyncio de QBClient (httpx.AsyncClient), para cientos de páginas en
+    vuelo desde un solo hilo.
+
+    Mismo contrato que QBClient: un access token por realm refrescado una sola
+    vez ante un 401, el circuit breaker compartido, caché opcional y un
+    controlador AIMD (AsyncAIMDController) que limita los requests en vuelo.
+    Los 429 y el backoff esperan con asyncio.sleep, sin bloquear al resto de
+    las tareas. Se crea y se usa dentro de un mismo event loop.
+    """
+
+    def __init__(self, realm_id, access_token, base_url=QB_BASE_URL, token_url=QB_TOKEN_URL,
+                 minor_version=QB_MINOR_VERSION, base_timeout=60, controller=None, cache=None,
+                 realm_name=None):
+        if httpx is None:
+            raise ImportError("qb_client='async' requiere httpx (agregarlo a requirements.txt o pip install httpx)")
+        if not base_url or not minor_version:
+            raise ValueError("Se requiere una URL base y el minor version")
+        self.realm_id = realm_id
+        self.realm_name = realm_name
+        self.base_url = base_url
+        self.token_url = token_url
+        self.minor_version = minor_version
+        self.base_timeout = base_timeout
+        self.cache = cache
+        self.breaker = get_breaker(f'quickbooks:{realm_id}')
+        self.controller = controller or get_async_controller(f'quickbooks:{realm_id}')
+        # tantas conexiones como requests en vuelo admite el controlador
+        connections = max(self.controller.max_limit, 10)
+        self.http = httpx.AsyncClient(limits=httpx.Limits(max_connections=connections,
+                                                          max_keepalive_connections=connections))
+        self._access_token = access_token
+        self._token_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self.http.aclose()
+
+    @property
+    def access_token(self):
+        return self._access_token
+
+    async def refresh_access_token(self, stale_token=None):
+        """
+        Refresca el access token. Con `stale_token`, solo si nadie lo refrescó ya
+        desde que ese token falló. Devuelve True si hay un token nuevo en uso.
+        """
+        async with self._token_lock:
+            if stale_token is not None and self._access_token != stale_token:
+                return True
+            new_access_token, new_refresh_token = await _refrescar_access_token(self.http, self.token_url, self.realm_name)
+            if not new_access_token:
+                return False
+            self._access_token = new_access_token
+            return True
+
+    def query_url(self):
+        return f"{self.base_url.rstrip('/')}/v3/company/{self.realm_id}/query"
+
+    async def _get(self, url, token, params, timeout):
+        headers = {
+            'Authorization': f'Bearer {token}',
+            'Accept': 'application/json',
+            'Content-Type': 'text/plain'
+        }
+        async with self.controller.slot():
+            request_start = time.perf_counter()
+            # con tareas intercaladas el pico de memoria de 'fetch' es aproximado
+            with profile_phase('fetch'):
+                response = await self.http.get(url, headers=headers, params=params, timeout=timeout)
+            return response, time.perf_counter() - request_start
+
+    async def fetch_page(self, query, start_position=1, max_results=1000, metrics=None, speculative=False):
+        """
+        Versión async de QBClient.fetch_page: mismas decisiones (PageFetch),
+        con httpx y asyncio.sleep para el backoff.
+        """
+        page = PageFetch(self, query, start_position, max_results, metrics, HTTPX_ERROR_KINDS)
+        data = page.cached()
+        if data is not None:
+            return data
+
+        if speculative:
+            page.begin_speculative()
+            try:
+                response, request_latency = await self._get(page.url, self._access_token, page.params,
+                                                            self.base_timeout)
+                return page.speculative_succeeded(response.status_code, response.content, request_latency)
+            except Exception as e:
+                raise page.speculative_missed(e) from e
+
+        page.begin()
+        for attempt, timeout, delay in page.attempts():
+            if delay:
+                await asyncio.sleep(delay)
+            try:
+                token = self._access_token
+                page.sending()
+                response, request_latency = await self._get(page.url, token, page.params, timeout)
+
+                status = page.classify(response.status_code, response.headers)
+                if status == RETRY_LATER:
+                    continue  # Reintentar sin contar como fallo
+                if status == REFRESH_TOKEN:
+                    if not await self.refresh_access_token(stale_token=token):
+                        raise ValueError("Error crítico: No se pudo refrescar el token")
+                    page.token_refreshed()
+                    page.sending()
+                    response, request_latency = await self._get(page.url, self._access_token, page.params, timeout)
+
+                response.raise_for_status()
+                return page.succeeded(response.content, request_latency)
+
+            except Exception as e:
+                page.failed(attempt, e)
+
+        page.give_up()
+
+
+async def iter_pages(client, query, start_position=1, max_results=100, metrics=None, prefetch=0):
+    """
+    Páginas de `query` en orden, como (start_position, data, seconds); versión
+    async de qb_sync.iter_pages. Las `prefetch` páginas siguientes son tareas
+    especulativas ya lanzadas; al cerrar el generador (aclose) se cancelan y
+    se espera a que terminen.
+    """
+    async def fetch(position, speculative=False):
+        started = time.perf_counter()
+        data = await client.fetch_page(query, start_position=position, max_results=max_results, metrics=metrics,
+                                       speculative=speculative)
+        return data, time.perf_counter() - started
+
+    in_flight = deque()
+    next_position = start_position
+    try:
+        while True:
+            # la página actual más `prefetch` siguientes, siempre en vuelo
+            while len(in_flight) <= max(prefetch, 0):
+                # la primera página se pide por el camino normal; las demás, por adelantado
+                in_flight.append((next_position, asyncio.ensure_future(fetch(next_position, bool(in_flight)))))
+                next_position += max_results
+            position, task = in_flight.popleft()
+            try:
+                data, seconds = await task
+            except SpeculativeFetchError:
+                data, seconds = await fetch(position)
+            yield position, data, seconds
+    finally:
+        for _, task in in_flight:
+            task.cancel()
+        # los pedidos descartados pueden haber fallado: no dejar la excepción sin leer
+        await asyncio.gather(*(task for _, task in in_flight), return_exceptions=True)
+
+
+async def _fetch_chunk(client, chunk, qb_entity, fields, ingested_at_utc_str, metrics, total_chunks, prefetch=0,
+                       deadline=None):
+    """
+    Versión async de qb_sync._fetch_chunk: el mismo recorrido (ChunkPages),
+    con las páginas de la iter_pages async.
+    """
+    chunk_pages = ChunkPages(client, chunk, qb_entity, fields, ingested_at_utc_str, metrics, total_chunks, deadline)
+    pages = iter_pages(client, chunk_pages.query, start_position=chunk_pages.start_position,
+                       max_results=chunk_pages.max_results, metrics=metrics, prefetch=prefetch)
+    try:
+        while True:
+            try:
+                start_position, data, page_duration = await pages.__anext__()
+            except CircuitOpenError:
+                chunk_pages.circuit_opened()
+                raise
+            if not chunk_pages.store(start_position, data, page_duration):
+                break
+    finally:
+        await pages.aclose()
+        chunk_pages.finish()
+
+    return chunk
+
+
+async def sync_entity_async(client, qb_entity, **kwargs):
+    """
+    sync_entity sobre AsyncQBClient: los chunks son tareas del event loop en
+    lugar de hilos, hasta max_concurrency a la vez. Mismos kwargs y mismo
+    resultado (ver qb_sync.EntitySync).
+    """
+    run = EntitySync(client, qb_entity, kwargs)
+    if run.verify_only:
+        return run.finish()
+
+    chunk_slots = asyncio.Semaphore(run.max_concurrency)
+
+    async def process(chunk):
+        # devuelve las sub-ventanas a reintentar ([] si terminó o quedó fallido)
+        while True:
+            async with chunk_slots:
+                # sin tiempo: el chunk que todavía esperaba turno pasa al checkpoint
+                if run.out_of_time():
+                    run.postpone([chunk])
+                    return []
+                try:
+                    await _fetch_chunk(client, chunk, qb_entity, run.fields, run.ingested_at_utc_str,
+                                       run.metrics, len(run.chunks), run.prefetch_pages, run.deadline)
+                except CircuitOpenError as open_error:
+                    if not run.defer(chunk, open_error):
+                        return run.chunk_failed(chunk, open_error)
+                    retry_after = open_error.retry_after
+                except Exception as error:
+                    run.log_chunk_error(chunk, error)
+                    return run.chunk_failed(chunk, error)
+                else:
+                    if chunk.get('interrupted'):
+                        run.chunk_interrupted(chunk)
+                    else:
+                        run.chunk_completed(chunk)
+                    return []
+            # circuito abierto: esperar fuera del semáforo y retomar el chunk
+            await asyncio.sleep(run.wait_seconds(retry_after))
+
+    # una pasada por todos los chunks; las sub-ventanas de los fallidos forman
+    # la pasada siguiente, tras el backoff
+    pending_chunks = run.chunks_to_process
+    while pending_chunks:
+        results = await asyncio.gather(*(process(chunk) for chunk in pending_chunks))
+        pending_chunks = [window for sub_windows in results for window in sub_windows]
+        if pending_chunks and run.out_of_time():
+            run.postpone(pending_chunks)
+            break
+        if pending_chunks:
+            run.metrics.log('WARNING', f'REINTENTANDO {len(pending_chunks)} sub-ventanas de chunks fallidos ({run.entity})')
+            await asyncio.sleep(run.wait_seconds(run.retry_delay(pending_chunks[0])))
+
+    # armar el DataFrame es CPU: en un hilo, para no frenar a las otras entidades
+    return await asyncio.to_thread(run.finish)
+
+
+async def sync_realm_async(client_options, qb_entities, kwargs):
+    """
+    Abre un AsyncQBClient con `client_options` (argumentos de AsyncQBClient),
+    refresca el token una vez y corre todas las entidades en el mismo event loop.
+    Devuelve {nombre de la entidad: DataFrame raw}.
+    """
+    async with AsyncQBClient(**client_options) as client:
+        print(f"REFRESCANDO TOKEN (realm {client.realm_id})")
+        if await client.refresh_access_token():
+            print(f"Token refrescado con exito")
+        else:
+            print("Error al regrescar el token, puede estar expirado")
+
+        print(f"SINCRONIZANDO (asyncio): {', '.join(qb_entity.name for qb_entity in qb_entities)}")
+        results = await asyncio.gather(
+            *(sync_entity_async(client, qb_entity, **kwargs) for qb_entity in qb_entities),
+            return_exceptions=True,
+        )
+    return _collect([qb_entity.name for qb_entity in qb_entities], results)
+
+
+async def sync_realms_async(realms, qb_entities, kwargs):
+    """
+    Varios realms en el mismo event loop, hasta max_parallel_realms a la vez;
+    cada uno con su cliente y su controlador (ver qb_sync.run_sync).
+    Devuelve una lista con el {entidad: DataFrame} de cada realm.
+    """
+    realm_slots = asyncio.Semaphore(kwargs.get('max_parallel_realms', 4))
+
+    async def sync_realm(client_options):
+        async with realm_slots:
+            return await sync_realm_async(client_options, qb_entities, kwargs)
+
+    results = await asyncio.gather(*(sync_realm(realm) for realm in realms), return_exceptions=True)
+    return list(_collect([realm['realm_id'] for realm in realms], results).values())
+
+
+def _collect(names, results):
+    # resultados de asyncio.gather(return_exceptions=True); si alguno falló, un solo error con todos
+    errors = {name: result for name, result in zip(names, results) if isinstance(result, BaseException)}
+    if errors:
+        raise RuntimeError(
+            f"Falló la sincronización de: {', '.join(f'{name} ({error})' for name, error in errors.items())}"
+        ) from next(iter(errors.values()))
+    return dict(zip(names, results))
+
+
+def run_coroutine(coroutine):
+    """
+    Corre `coroutine` hasta el final desde código sincrónico (el load_data de
+    Mage). Si el hilo ya tiene un event loop corriendo (p. ej. el kernel del
+    editor), la corre en un hilo aparte con su propio loop.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='qb-async') as executor:
+        return executor.submit(contextvars.copy_context().run, asyncio.run, coroutine).result()
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+
+# Cabecera de cada archivo: momento de escritura (para el TTL), float64
+_HEADER = struct.Struct('<d')
+
+
+class PageCache:
+    """
+    Caché en disco de respuestas de páginas de QuickBooks, direccionada por contenido.
+
+    La clave es el sha256 de (base_url, realm, query paginada, minor version);
+    cada página se guarda comprimida con zlib en `<cache_dir>/<k[:2]>/<k>.z`.
+    Una entrada vence `ttl_seconds` después de escrita. El mtime del archivo se
+    actualiza en cada acierto y sirve de último acceso: al pasar `max_bytes` se
+    borran las entradas menos usadas (LRU) hasta quedar en el 90% del tope.
+
+    Pensada para re-ejecuciones en modo edición y reintentos de bloques
+    posteriores; por eso es opt-in (qb_cache=True en el loader).
+    """
+
+    def __init__(self, cache_dir, ttl_seconds=86400, max_bytes=512 * 1024 * 1024, compress_level=6):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.compress_level = compress_level
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._size = sum(size for _, _, size in self._entries())
+
+    @staticmethod
+    def key(base_url, realm_id, query, minor_version):
+        raw = json.dumps([base_url.rstrip('/'), str(realm_id), query, str(minor_version)])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f'{key}.z')
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.z'):
+                    continue
+                file_path = os.path.join(root, name)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                yield file_path, stat.st_mtime, stat.st_size
+
+    def get(self, key):
+        """
+        Cuerpo de la respuesta (bytes) o None si no está o venció.
+        """
+        file_path = self._path(key)
+        try:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+            (written_at,) = _HEADER.unpack_from(data)
+            if time.time() - written_at > self.ttl_seconds:
+                self._remove(file_path)
+                body = None
+            else:
+                body = zlib.decompress(data[_HEADER.size:])
+                os.utime(file_path)  # último acceso, para el LRU
+        except (OSError, struct.error, zlib.error):
+            body = None
+        with self._lock:
+            if body is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return body
+
+    def put(self, key, body):
+        file_path = self._path(key)
+        data = _HEADER.pack(time.time()) + zlib.compress(body, self.compress_level)
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            previous = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+            # escribir y renombrar: un lector concurrente nunca ve un archivo a medias
+            tmp_path = f'{file_path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, file_path)
+        except OSError as e:
+            print(f'No se pudo guardar la página en la caché {self.cache_dir}: {e}')
+            return
+        with self._lock:
+            self._size += len(data) - previous
+            over_limit = self._size > self.max_bytes
+        if over_limit:
+            self._evict()
+
+    def _remove(self, file_path):
+        try:
+            size = os.path.getsize(file_path)
+            os.remove(file_path)
+        except OSError:
+            return
+        with self._lock:
+            self._size -= size
+
+    def _evict(self):
+        target = self.max_bytes * 0.9
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[1])
+            self._size = sum(size for _, _, size in entries)
+            for file_path, _, size in entries:
+                if self._size <= target:
+                    break
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    continue
+                self._size -= size
+                self.evictions += 1
+
+    def clear(self):
+        for file_path, _, _ in list(self._entries()):
+            self._remove(file_path)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'cache_dir': self.cache_dir,
+                'size_mb': round(self._size / 1e6, 2),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
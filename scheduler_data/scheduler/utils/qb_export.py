@@ -0,0 +1,299 @@
+from psycopg2.extras import execute_values
+
+from scheduler.utils.pg_copy import copy_text_frame, qualified_name, quote_ident
+from scheduler.utils.profiling import profile_phase
+
+
+EXPORT_METHODS = ('copy', 'batched', 'row')
+
+# clave de las tablas raw: el id de QuickBooks solo es único dentro de un realm (compañía)
+RAW_KEY_COLUMNS = ('realm_id', 'id')
+
+
+# Una corrida con qb_fields trae solo algunas propiedades (request_payload marca
+# payload_schema.partial): se mezclan sobre el payload guardado en lugar de
+# reemplazarlo, para no perder el resto del registro. QuickBooks devuelve cada
+# propiedad proyectada completa, así que basta la mezcla de primer nivel (||).
+PARTIAL_PAYLOAD_UPDATE = (
+    "CASE WHEN (EXCLUDED.request_payload->'payload_schema'->>'partial')::boolean "
+    "THEN COALESCE({target}.payload, '{{}}'::jsonb) || EXCLUDED.payload "
+    "ELSE EXCLUDED.payload END"
+)
+
+
+def _update_value(target, col, columns):
+    if col == 'payload' and 'request_payload' in columns:
+        return PARTIAL_PAYLOAD_UPDATE.format(target=target)
+    return f'EXCLUDED.{quote_ident(col)}'
+
+
+def _upsert_sql(target, columns, source, key_columns):
+    column_list = ', '.join(quote_ident(col) for col in columns)
+    keys = ', '.join(quote_ident(col) for col in key_columns)
+    updates = ', '.join(
+        f'{quote_ident(col)} = {_update_value(target, col, columns)}'
+        for col in columns if col not in key_columns
+    )
+    return (
+        f'INSERT INTO {target} ({column_list}) {source} '
+        f'ON CONFLICT ({keys}) DO UPDATE SET {updates} '
+        # xmax = 0 solo en filas recién insertadas: permite contar insertados vs actualizados
+        f'RETURNING (xmax = 0)'
+    )
+
+
+def _count_results(rows):
+    inserted = sum(1 for (is_insert,) in rows if is_insert)
+    return inserted, len(rows) - inserted
+
+
+def _upsert_copy(conn, df, target, columns, key_columns):
+    """
+    COPY del DataFrame a una tabla temporal y un único INSERT ... ON CONFLICT
+    hacia la tabla destino. Los payloads en bytes viajan tal cual hasta Postgres.
+    """
+    keys = ', '.join(quote_ident(col) for col in key_columns)
+    column_list = ', '.join(quote_ident(col) for col in columns)
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMP TABLE qb_upsert_staging (LIKE {target} INCLUDING DEFAULTS) ON COMMIT DROP'
+        )
+        # orden de llegada de cada fila, para desempatar duplicados
+        cursor.execute('ALTER TABLE qb_upsert_staging ADD COLUMN qb_staging_row BIGSERIAL')
+        copy_text_frame(cursor, df, 'qb_upsert_staging', columns=columns)
+        # DISTINCT ON evita que el mismo id aparezca dos veces en el mismo INSERT;
+        # gana la fila más reciente (como keep='last' en _upsert_batched)
+        newest_first = ['"qb_staging_row" DESC']
+        if 'ingested_at_utc' in columns:
+            newest_first.insert(0, '"ingested_at_utc" DESC NULLS LAST')
+        source = (
+            f'SELECT DISTINCT ON ({keys}) {column_list} FROM qb_upsert_staging '
+            f'ORDER BY {keys}, {", ".join(newest_first)}'
+        )
+        cursor.execute(_upsert_sql(target, columns, source, key_columns))
+        inserted, updated = _count_results(cursor.fetchall())
+    conn.commit()
+    return {'inserted': inserted, 'updated': updated, 'errors': 0}
+
+
+def _row_value(value):
+    if value is None or value != value:
+        return None
+    if isinstance(value, bytes):
+        # psycopg2 enviaría bytes como bytea; JSONB necesita texto
+        return value.decode('utf-8')
+    return value
+
+
+def _upsert_batched(conn, df, target, columns, key_columns, batch_size):
+    """
+    INSERT ... ON CONFLICT con VALUES de `batch_size` filas por sentencia
+    (execute_values), sin tabla temporal.
+    """
+    # un mismo id dos veces en un lote haría fallar el ON CONFLICT DO UPDATE
+    df = df.drop_duplicates(subset=list(key_columns), keep='last')
+    sql = _upsert_sql(target, columns, 'VALUES %s', key_columns)
+    rows = [
+        [_row_value(value) for value in row]
+        for row in df[columns].itertuples(index=False, name=None)
+    ]
+    with conn.cursor() as cursor:
+        results = execute_values(cursor, sql, rows, page_size=batch_size, fetch=True)
+    conn.commit()
+    inserted, updated = _count_results(results)
+    return {'inserted': inserted, 'updated': updated, 'errors': 0}
+
+
+def _upsert_rows(conn, df, target, columns, key_columns):
+    """
+    Camino anterior: un INSERT ... ON CONFLICT por fila, con savepoint para que
+    una fila inválida no deshaga las anteriores.
+    """
+    placeholders = ', '.join(['%s'] * len(columns))
+    sql = _upsert_sql(target, columns, f'VALUES ({placeholders})', key_columns)
+    inserted = updated = errors = 0
+
+    with conn.cursor() as cursor:
+        for index_num, row in enumerate(df[columns].itertuples(index=False, name=None)):
+            values = [_row_value(value) for value in row]
+            try:
+                cursor.execute('SAVEPOINT qb_row')
+                cursor.execute(sql, values)
+                row_inserted, row_updated = _count_results(cursor.fetchall())
+                inserted += row_inserted
+                updated += row_updated
+                cursor.execute('RELEASE SAVEPOINT qb_row')
+            except Exception as e:
+                errors += 1
+                cursor.execute('ROLLBACK TO SAVEPOINT qb_row')
+                print(f"Error procesando registro {index_num + 1} (ID: {row[columns.index('id')]}): {e}")
+
+            processed_count = index_num + 1
+            if processed_count % 100 == 0:
+                print(f"Procesados: {processed_count}/{len(df)} registros")
+    conn.commit()
+    return {'inserted': inserted, 'updated': updated, 'errors': errors}
+
+
+def upsert_raw_frame(conn, df, schema_name, table_name, method='copy', key_columns=RAW_KEY_COLUMNS, batch_size=1000):
+    """
+    UPSERT idempotente de un DataFrame raw de QuickBooks en schema_name.table_name.
+
+    Args:
+        conn: conexión psycopg2 (p. ej. `loader.conn` de Mage)
+        method (str): 'copy' (COPY a tabla temporal + un INSERT ... ON CONFLICT),
+            'batched' (INSERT ... ON CONFLICT por lotes de batch_size filas)
+            o 'row' (un UPSERT por fila, el método original)
+        key_columns (tuple): columnas de la clave primaria
+        batch_size (int): filas por sentencia en el método 'batched'
+
+    Returns:
+        dict: conteos 'inserted', 'updated' y 'errors'
+    """
+    if method not in EXPORT_METHODS:
+        raise ValueError(f"Método de exportación inválido '{method}'. Use uno de {EXPORT_METHODS}")
+
+    target = qualified_name(schema_name, table_name)
+    columns = list(df.columns)
+    try:
+        if method == 'copy':
+            return _upsert_copy(conn, df, target, columns, list(key_columns))
+        if method == 'batched':
+            return _upsert_batched(conn, df, target, columns, list(key_columns), batch_size)
+        return _upsert_rows(conn, df, target, columns, list(key_columns))
+    except Exception:
+        conn.rollback()
+        raise
+
+
+RAW_TABLE_DDL = """
+CREATE TABLE {target} (
+    realm_id VARCHAR(50) NOT NULL,
+    id VARCHAR(50) NOT NULL,
+    payload JSONB,
+    ingested_at_utc TIMESTAMPTZ,
+    extract_window_start_utc TIMESTAMPTZ,
+    extract_window_end_utc TIMESTAMPTZ,
+    page_number INTEGER,
+    page_size INTEGER,
+    request_payload JSONB,
+    PRIMARY KEY (realm_id, id)
+);
+"""
+
+# Tablas creadas antes de la clave por realm: el realm de cada fila ya estaba en
+# request_payload. Idempotente; corre una vez por tabla desde export_raw_frame.
+RAW_TABLE_REALM_MIGRATION = """
+ALTER TABLE {target} ADD COLUMN IF NOT EXISTS realm_id VARCHAR(50);
+UPDATE {target} SET realm_id = request_payload->>'realm_id' WHERE realm_id IS NULL;
+ALTER TABLE {target} ALTER COLUMN realm_id SET NOT NULL;
+"""
+
+# nombre real de la clave primaria: no siempre es <tabla>_pkey (p. ej. tablas
+# renombradas o claves creadas con CONSTRAINT <nombre>)
+PRIMARY_KEY_NAME_SQL = """
+SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p';
+"""
+
+
+def _migrate_realm_key(loader, schema_name, table_name):
+    """
+    Agrega realm_id a la clave primaria de una tabla raw creada con la clave (id).
+    """
+    has_realm = loader.execute(f"""
+    SELECT 1
+    FROM information_schema.columns
+    WHERE table_schema = '{schema_name}' AND table_name = '{table_name}' AND column_name = 'realm_id';
+    """)
+    if has_realm:
+        return
+    print(f"Migrando '{schema_name}.{table_name}' a la clave primaria (realm_id, id)...")
+    try:
+        target = qualified_name(schema_name, table_name)
+        with loader.conn.cursor() as cursor:
+            cursor.execute(RAW_TABLE_REALM_MIGRATION.format(target=target))
+            cursor.execute(PRIMARY_KEY_NAME_SQL, (target,))
+            pkey = cursor.fetchone()
+            if pkey:
+                cursor.execute(f'ALTER TABLE {target} DROP CONSTRAINT {quote_ident(pkey[0])}')
+            cursor.execute(f'ALTER TABLE {target} ADD PRIMARY KEY (realm_id, id)')
+        loader.conn.commit()
+    except Exception:
+        loader.conn.rollback()
+        raise
+    print(f"Tabla '{schema_name}.{table_name}' migrada")
+
+
+def export_raw_frame(loader, df, schema_name, table_name, export_method='copy'):
+    """
+    Crea schema_name.table_name si no existe y hace el UPSERT de `df` con
+    upsert_raw_frame, sobre la conexión ya abierta de `loader` (Postgres de Mage).
+    Con la misma conexión se pueden exportar varias entidades seguidas.
+
+    Returns:
+        dict: conteos 'inserted', 'updated', 'errors' y 'final_count'
+    """
+    print(f"Exportando {len(df)} registros a {schema_name}.{table_name}")
+    print(f"Método: UPSERT ({export_method})")
+
+    # Verificar si la tabla existe
+    verify_table_sql = f"""
+    SELECT table_name 
+    FROM information_schema.tables 
+    WHERE table_schema = '{schema_name}' AND table_name = '{table_name}';
+    """
+
+    try:
+        table_exists = loader.execute(verify_table_sql)
+        if table_exists and len(table_exists) > 0:
+            print(f"✓ Tabla '{schema_name}.{table_name}' ya existe")
+            _migrate_realm_key(loader, schema_name, table_name)
+        else:
+            print(f"Tabla '{schema_name}.{table_name}' no existe, creándola...")
+
+            # Crear tabla si no existe
+            result = loader.execute(RAW_TABLE_DDL.format(target=f'{schema_name}.{table_name}'))
+            print(f"Comando CREATE TABLE ejecutado - Resultado: {result}")
+
+            # Verificar nuevamente que se creó
+            table_exists_after = loader.execute(verify_table_sql)
+            if table_exists_after and len(table_exists_after) > 0:
+                print(f"Tabla '{schema_name}.{table_name}' creada exitosamente")
+            else:
+                print(f"Tabla '{schema_name}.{table_name}' podría no haberse creado, pero continuando...")
+
+    except Exception as e:
+        print(f"Error verificando/creando tabla '{schema_name}.{table_name}': {e}")
+        print("Continuando con el procesamiento...")
+
+    # UPSERT: COPY a tabla temporal + INSERT ... ON CONFLICT (o por lotes / fila por fila)
+    print(f"Procesando {len(df)} registros con método '{export_method}'...")
+    try:
+        with profile_phase('export'):
+            stats = upsert_raw_frame(loader.conn, df, schema_name, table_name, method=export_method)
+    except Exception as e:
+        print(f"Error en UPSERT de {schema_name}.{table_name}: {e}")
+        raise
+
+    # Estadísticas finales
+    final_count_sql = f"SELECT COUNT(*) FROM {schema_name}.{table_name};"
+    try:
+        final_result = loader.execute(final_count_sql)
+        final_count = final_result[0][0] if final_result else 0
+    except Exception as e:
+        print(f"Error obteniendo estadísticas finales: {e}")
+        # Intentar rollback y luego obtener estadísticas
+        try:
+            loader.execute("ROLLBACK;")
+            final_result = loader.execute(final_count_sql)
+            final_count = final_result[0][0] if final_result else 0
+        except:
+            final_count = "N/A"
+
+    print(f"\nUPSERT COMPLETADO ({export_method}) - {schema_name}.{table_name}")
+    print(f"Total registros procesados: {len(df)}")
+    print(f"Registros insertados (nuevos): {stats['inserted']}")
+    print(f"Registros actualizados (existentes): {stats['updated']}")
+    print(f"Errores: {stats['errors']}")
+    print(f"Total registros en tabla: {final_count}")
+    return {**stats, 'final_count': final_count}
@@ -0,0 +1,29 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional; sin él se usa la librería estándar
+    orjson = None
+
+
+# orjson.JSONDecodeError hereda de json.JSONDecodeError, así que los except
+# existentes siguen funcionando con cualquiera de las dos librerías.
+JSONDecodeError = json.JSONDecodeError
+
+
+def loads(data):
+    """
+    Decodifica un body JSON (bytes o str) directamente, sin pasar por response.json().
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_bytes(obj) -> bytes:
+    """
+    Serializa un registro a bytes UTF-8 compactos, listos para el COPY a JSONB.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
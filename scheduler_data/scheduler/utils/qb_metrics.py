@@ -0,0 +1,198 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+
+LOG_LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+
+PAGE_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CHUNK_DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+
+# Contadores y su descripción en el formato de Prometheus
+COUNTERS = {
+    'requests': 'Requests HTTP enviados al API de QuickBooks',
+    'pages': 'Páginas recibidas con éxito',
+    'records': 'Registros recibidos',
+    'bytes_received': 'Bytes de respuesta recibidos',
+    'retries': 'Reintentos por cualquier causa',
+    'throttled': 'Respuestas 429 (rate limit)',
+    'unauthorized': 'Respuestas 401 (token vencido)',
+    'token_refreshes': 'Tokens refrescados',
+    'timeouts': 'Requests con timeout',
+    'connection_errors': 'Errores de conexión',
+    'request_errors': 'Otros errores HTTP',
+    'json_errors': 'Respuestas con JSON inválido',
+    'unexpected_errors': 'Errores inesperados',
+    'failed_fetches': 'Páginas que agotaron los reintentos',
+    'failed_chunks': 'Chunks con error',
+    'circuit_opened': 'Aperturas del circuit breaker',
+    'deferred_chunks': 'Chunks diferidos por circuito abierto',
+    'retried_chunks': 'Chunks reencolados en sub-ventanas tras fallar',
+    'interrupted_chunks': 'Chunks cortados por time_budget_seconds',
+    'speculative_misses': 'Páginas pedidas por adelantado (prefetch) que no llegaron y se volvieron a pedir',
+    'cache_hits': 'Páginas servidas desde la caché en disco',
+    'cache_misses': 'Páginas buscadas en la caché y pedidas al API',
+}
+
+
+class Histogram:
+    """
+    Histograma acumulativo con buckets fijos (como los de Prometheus) que además
+    guarda las observaciones para calcular percentiles en el resumen JSON.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.values = []
+
+    def observe(self, value):
+        self.values.append(float(value))
+
+    def bucket_counts(self):
+        values = np.asarray(self.values, dtype=float)
+        return [(le, int((values <= le).sum())) for le in self.buckets] + [('+Inf', len(values))]
+
+    def summary(self):
+        if not self.values:
+            return {'count': 0, 'sum': 0.0}
+        values = np.asarray(self.values, dtype=float)
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {
+            'count': len(values),
+            'sum': round(float(values.sum()), 4),
+            'min': round(float(values.min()), 4),
+            'max': round(float(values.max()), 4),
+            'p50': round(float(p50), 4),
+            'p95': round(float(p95), 4),
+            'p99': round(float(p99), 4),
+            'buckets': {str(le): count for le, count in self.bucket_counts()},
+        }
+
+
+class QBMetrics:
+    """
+    Colector de métricas de una corrida de ingesta de QuickBooks.
+
+    Reemplaza los print por intento/página: los eventos se cuentan y los mensajes
+    solo se imprimen si su nivel alcanza `log_level` (DEBUG muestra el detalle
+    por intento y por página; INFO, solo el resumen por chunk y por corrida).
+    Al final `write` deja un resumen JSON y un archivo en formato de texto de
+    Prometheus (apto para el textfile collector de node_exporter). Con `realm`
+    (corridas multi-realm) los archivos y las series llevan el realm.
+    """
+
+    def __init__(self, entity, run_id=None, log_level='INFO', realm=None):
+        self.entity = entity
+        self.realm = realm
+        self.run_id = run_id or datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+        self.log_level = LOG_LEVELS[str(log_level).upper()]
+        self.started_at = time.time()
+        self.counters = {name: 0 for name in COUNTERS}
+        self.page_latency = Histogram(PAGE_LATENCY_BUCKETS)
+        self.chunk_duration = Histogram(CHUNK_DURATION_BUCKETS)
+        self.chunks = []
+        self.info = {}
+        self._lock = threading.Lock()
+
+    def log(self, level, message):
+        if LOG_LEVELS[level] >= self.log_level:
+            print(message)
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def set_info(self, name, value):
+        """
+        Dato descriptivo de la corrida (p. ej. el estado del control de concurrencia).
+        """
+        with self._lock:
+            self.info[name] = value
+
+    def observe_page(self, seconds, records, bytes_received=0):
+        with self._lock:
+            self.page_latency.observe(seconds)
+            self.counters['pages'] += 1
+            self.counters['records'] += records
+            self.counters['bytes_received'] += bytes_received
+
+    def observe_chunk(self, chunk_number, start_date, end_date, records, pages, seconds, status='completed', error=None):
+        with self._lock:
+            self.chunk_duration.observe(seconds)
+            if status == 'failed':
+                self.counters['failed_chunks'] += 1
+            self.chunks.append({
+                'chunk_number': chunk_number,
+                'start_date': start_date,
+                'end_date': end_date,
+                'records': records,
+                'pages': pages,
+                'seconds': round(seconds, 3),
+                'records_per_second': round(records / max(seconds, 0.001), 2),
+                'status': status,
+                'error': error,
+            })
+
+    def summary(self):
+        elapsed = time.time() - self.started_at
+        with self._lock:
+            return {
+                'entity': self.entity,
+                'realm': self.realm,
+                'run_id': self.run_id,
+                'elapsed_seconds': round(elapsed, 3),
+                'records_per_second': round(self.counters['records'] / max(elapsed, 0.001), 2),
+                'counters': dict(self.counters),
+                'page_latency_seconds': self.page_latency.summary(),
+                'chunk_duration_seconds': self.chunk_duration.summary(),
+                'chunks': list(self.chunks),
+                'info': dict(self.info),
+            }
+
+    def to_prometheus(self):
+        labels = f'entity="{self.entity}"'
+        if self.realm is not None:
+            labels += f',realm="{self.realm}"'
+        lines = []
+        with self._lock:
+            for name, help_text in COUNTERS.items():
+                metric = f'qb_{name}_total'
+                lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter',
+                          f'{metric}{{{labels}}} {self.counters[name]}']
+            for metric, help_text, histogram in (
+                ('qb_page_latency_seconds', 'Latencia por página, incluidos reintentos', self.page_latency),
+                ('qb_chunk_duration_seconds', 'Duración por chunk de fechas', self.chunk_duration),
+            ):
+                lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} histogram']
+                for le, count in histogram.bucket_counts():
+                    lines.append(f'{metric}_bucket{{{labels},le="{le}"}} {count}')
+                lines.append(f'{metric}_sum{{{labels}}} {sum(histogram.values)}')
+                lines.append(f'{metric}_count{{{labels}}} {len(histogram.values)}')
+        metric = 'qb_last_run_timestamp_seconds'
+        lines += [f'# HELP {metric} Fin de la última corrida', f'# TYPE {metric} gauge',
+                  f'{metric}{{{labels}}} {time.time():.0f}']
+        return '\n'.join(lines) + '\n'
+
+    def write(self, output_dir):
+        """
+        Escribe `qb_<entity>[_<realm>]_<run_id>.json` y `qb_<entity>[_<realm>].prom`
+        (la última corrida, con nombre fijo para el textfile collector). Devuelve
+        las dos rutas.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        name = f'qb_{self.entity.lower()}' + (f'_{self.realm}' if self.realm is not None else '')
+        json_path = os.path.join(output_dir, f'{name}_{self.run_id}.json')
+        prom_path = os.path.join(output_dir, f'{name}.prom')
+
+        with open(json_path, 'w') as f:
+            json.dump(self.summary(), f, indent=2, default=str)
+        # escribir y renombrar para que el collector nunca lea un archivo a medias
+        tmp_path = prom_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, prom_path)
+        return json_path, prom_path
@@ -0,0 +1,50 @@
+def resolve_fields(qb_fields, entity):
+    """
+    Lista de campos a proyectar para `entity`.
+
+    `qb_fields` puede ser una lista (se aplica tal cual) o un dict por entidad,
+    p. ej. {'Invoice': ['Id', 'TotalAmt', 'TxnDate']}. None o vacío = todos los campos.
+    """
+    if not qb_fields:
+        return None
+    if isinstance(qb_fields, dict):
+        fields = qb_fields.get(entity)
+    elif isinstance(qb_fields, str):
+        fields = [field.strip() for field in qb_fields.split(',')]
+    else:
+        fields = list(qb_fields)
+    return [field for field in fields if field] or None
+
+
+def projected_fields(fields, filter_field):
+    """
+    Asegura que la proyección incluya Id y el campo raíz del filtro de fechas
+    (MetaData para MetaData.LastUpdatedTime), sin duplicados y en orden.
+    """
+    required = ['Id', filter_field.split('.')[0]]
+    result = []
+    for field in required + list(fields):
+        if field not in result:
+            result.append(field)
+    return result
+
+
+def build_entity_query(entity, filter_field, start_utc, end_utc, fields=None):
+    """
+    Query de QuickBooks para una ventana de fechas; con `fields` la respuesta
+    solo trae esas propiedades en lugar de `select *`.
+    """
+    select = ', '.join(projected_fields(fields, filter_field)) if fields else '*'
+    return (
+        f"select {select} from {entity} "
+        f"where {filter_field} >= '{start_utc}' and {filter_field} <= '{end_utc}'"
+    )
+
+
+def payload_schema(fields, filter_field):
+    """
+    Descripción del payload guardado: completo o parcial con los campos proyectados.
+    """
+    if not fields:
+        return {'partial': False, 'fields': None}
+    return {'partial': True, 'fields': projected_fields(fields, filter_field)}
@@ -0,0 +1,1505 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from mage_ai.data_preparation.shared.secrets import get_secret_value
+from mage_ai.settings.repo import get_repo_path
+from scheduler.utils import qb_json
+from scheduler.utils.adaptive_concurrency import get_async_controller, get_controller, load_limits, save_limits
+from scheduler.utils.circuit_breaker import CLOSED, CircuitOpenError, get_breaker
+from scheduler.utils.profiling import profile_phase
+from scheduler.utils.qb_cache import PageCache
+from scheduler.utils.qb_frames import PageFrameBuilder
+from scheduler.utils.qb_metrics import QBMetrics
+from scheduler.utils.qb_query import build_entity_query, payload_schema, resolve_fields
+
+
+QB_BASE_URL = 'https://sandbox-quickbooks.api.intuit.com'
+QB_TOKEN_URL = 'https://oauth.platform.intuit.com/oauth2/v1/tokens/bearer'
+QB_MINOR_VERSION = 75
+
+
+@dataclass(frozen=True)
+class QBEntity:
+    """
+    Lo único que cambia entre entidades: nombre en el API, campo de fechas del
+    filtro y tabla destino en el esquema raw.
+    """
+    name: str
+    entity: str
+    filter_field: str
+    table: str
+
+
+# Registro de entidades sincronizadas; agregar una entidad es agregar una línea
+QB_ENTITIES = {
+    'invoices': QBEntity('invoices', 'Invoice', 'TxnDate', 'qb_invoices'),
+    'customers': QBEntity('customers', 'Customer', 'MetaData.LastUpdatedTime', 'qb_customer'),
+    'items': QBEntity('items', 'Item', 'MetaData.LastUpdatedTime', 'qb_item'),
+}
+
+
+def get_entity(name):
+    try:
+        return QB_ENTITIES[name]
+    except KeyError:
+        raise ValueError(f"Entidad desconocida '{name}'. Use una de {sorted(QB_ENTITIES)}")
+
+
+def realm_secret(key, realm_name=None):
+    """
+    Secreto `key` ('realm_id', 'access_token', 'refresh_token', 'client_id',
+    'client_secret') de un realm: qb_<realm_name>_<key>, o qb_<key> para el
+    realm por defecto. client_id y client_secret son de la app de Intuit y
+    caen en qb_<key> si el realm no tiene los suyos.
+    """
+    if realm_name is None:
+        return get_secret_value(f'qb_{key}')
+    value = get_secret_value(f'qb_{realm_name}_{key}')
+    if value is None and key in ('client_id', 'client_secret'):
+        value = get_secret_value(f'qb_{key}')
+    return value
+
+
+def _token_request(realm_name=None):
+    """
+    Headers y body del POST de refresh token (compartido con el cliente async).
+    """
+    headers = {
+        'Content-Type': 'application/x-www-form-urlencoded',
+        'Accept': 'application/json'
+    }
+
+    data = {
+        'grant_type': 'refresh_token',
+        'refresh_token': realm_secret('refresh_token', realm_name),
+        'client_id': realm_secret('client_id', realm_name),
+        'client_secret': realm_secret('client_secret', realm_name)
+    }
+    return headers, data
+
+
+def _refrescar_access_token(token_url=QB_TOKEN_URL, session=None, realm_name=None):
+
+    headers, data = _token_request(realm_name)
+
+    try:
+        print('Post para refrescar token')
+        response = (session or requests).post(token_url, headers=headers, data=data, timeout=60)
+        response.raise_for_status()
+        token_data = response.json()
+        new_access_token = token_data.get('access_token')
+        new_refresh_token = token_data.get('refresh_token')
+
+        if new_access_token:
+            print('Exito al refrescar token')
+            return new_access_token, new_refresh_token
+        else:
+            raise ValueError("Error al solicitar nuevo token")
+
+    except requests.exceptions.RequestException as e:
+        print(f'Error al refrescar token: {e}')
+        return None, None
+    except json.JSONDecodeError as e:
+        print(f'Error al decodificar respuesta JSON: {e}')
+        return None, None
+
+
+def _handle_failure(attempt, max_retries, breaker, error_type, metrics):
+    # el fallo se registra en el breaker compartido; si lo abre, no seguir reintentando
+    if breaker.record_failure():
+        metrics.inc('circuit_opened')
+        metrics.log('ERROR', f'CIRCUIT BREAKER ABIERTO ({breaker.name}) tras {error_type} - '
+                             f'sin requests por {breaker.retry_after():.0f}s')
+        raise CircuitOpenError(breaker.name, breaker.retry_after())
+
+    consecutive_failures = breaker.snapshot()['consecutive_failures']
+    if attempt == max_retries - 1:  # Último intento
+        metrics.log('WARNING', f'ÚLTIMO INTENTO FALLADO - Tipo: {error_type}')
+        metrics.log('WARNING', f'Fallos consecutivos acumulados: {consecutive_failures}')
+    else:
+        next_delay = 1 * (2 ** attempt)  # Próximo delay exponencial
+        metrics.log('DEBUG', f'Preparando reintento con backoff exponencial de {next_delay}s')
+
+
+class SpeculativeFetchError(Exception):
+    """
+    Una página pedida por adelantado (prefetch) no llegó en su único intento.
+    No cuenta para el circuit breaker ni para el controlador AIMD: si la página
+    hace falta, iter_pages la vuelve a pedir por el camino normal.
+    """
+
+
+MAX_FETCH_RETRIES = 5
+
+# acción del cliente según la respuesta (PageFetch.classify)
+RESPONSE_OK = 'ok'
+RETRY_LATER = 'retry'  # 429: el controlador ya pausó los slots; reintentar sin contar fallo
+REFRESH_TOKEN = 'refresh'  # 401: refrescar el token y repetir el request una vez
+
+# tipo de error -> (contador de QBMetrics, etiqueta en los logs y en el breaker)
+ERROR_KINDS = {
+    'timeout': ('timeouts', 'TIMEOUT'),
+    'connection': ('connection_errors', 'CONNECTION_ERROR'),
+    'request': ('request_errors', 'REQUEST_ERROR'),
+    'json': ('json_errors', 'JSON_ERROR'),
+    'unexpected': ('unexpected_errors', 'UNEXPECTED_ERROR'),
+}
+
+# excepciones de requests por tipo, de la más específica a la más general
+REQUESTS_ERROR_KINDS = (
+    (requests.exceptions.Timeout, 'timeout'),
+    (requests.exceptions.ConnectionError, 'connection'),
+    (requests.exceptions.RequestException, 'request'),
+    (json.JSONDecodeError, 'json'),
+)
+
+
+def classify_error(error, error_kinds):
+    """
+    Tipo de `error` según `error_kinds` (pares (excepción, tipo) del cliente HTTP).
+    """
+    for error_type, kind in error_kinds:
+        if isinstance(error, error_type):
+            return kind
+    return 'unexpected'
+
+
+def backoff_delay(attempt, base_delay=1):
+    # backoff exponencial, solo después del primer intento: 0, 1s, 2s, 4s, 8s
+    return 0 if attempt == 0 else base_delay * (2 ** (attempt - 1))
+
+
+def attempt_timeout(base_timeout, attempt):
+    # timeout incremental
+    return base_timeout + attempt * 30
+
+
+class PageFetch:
+    """
+    Lectura de una página, sin I/O: caché, circuit breaker, clasificación de
+    cada respuesta y de cada error, reintentos con backoff y métricas.
+
+    QBClient (requests) y qb_async.AsyncQBClient (httpx) la usan igual y solo
+    ponen el request, el refresh del token y la espera (time.sleep o
+    asyncio.sleep), así las dos versiones no se separan.
+    """
+
+    def __init__(self, client, query, start_position, max_results, metrics, error_kinds):
+        # sin colector explícito, uno descartable con el nivel de log por defecto
+        self.metrics = metrics or QBMetrics('QuickBooks')
+        self.client = client
+        self.breaker = client.breaker
+        self.controller = client.controller
+        self.error_kinds = error_kinds
+        self.start_position = start_position
+        self.max_retries = MAX_FETCH_RETRIES
+        self.last_error = None
+
+        # paginación
+        self.paginated_query = f"{query} STARTPOSITION {start_position} MAXRESULTS {max_results}"
+        self.params = {
+            'query': self.paginated_query,
+            'minorversion': client.minor_version
+        }
+        self.url = client.query_url()
+        self.cache_key = None
+        if client.cache is not None:
+            self.cache_key = PageCache.key(client.base_url, client.realm_id, self.paginated_query, client.minor_version)
+
+    def cached(self):
+        """
+        Caché opcional: una página ya leída vuelve desde disco, sin gastar cuota del API.
+        """
+        if self.cache_key is None:
+            return None
+        metrics = self.metrics
+        body = self.client.cache.get(self.cache_key)
+        if body is None:
+            metrics.inc('cache_misses')
+            return None
+        metrics.inc('cache_hits')
+        metrics.log('DEBUG', f'Página desde posición {self.start_position} leída de la caché')
+        with profile_phase('parse'):
+            return qb_json.loads(body)
+
+    def begin(self):
+        # circuit breaker compartido por realm (todos los bloques e hilos del proceso).
+        # Abierto: CircuitOpenError avisa al llamador cuánto falta, sin dormir acá ni
+        # devolver None (que se tomaría como "no hay más datos").
+        self.breaker.before_call()
+
+    def attempts(self):
+        """
+        (intento, timeout, espera previa) de cada intento.
+        """
+        metrics = self.metrics
+        for attempt in range(self.max_retries):
+            delay = backoff_delay(attempt)
+            if delay:
+                metrics.log('DEBUG', f'Backoff exponencial: esperando {delay}s antes del intento {attempt + 1}')
+                metrics.inc('retries')
+            timeout = attempt_timeout(self.client.base_timeout, attempt)
+            metrics.log('DEBUG', f'Intento {attempt + 1}/{self.max_retries} - Request al API')
+            metrics.log('DEBUG', f'URL: {self.client.base_url}')
+            metrics.log('DEBUG', f'Query: {self.paginated_query}')
+            metrics.log('DEBUG', f'Timeout: {timeout}s')
+            metrics.log('DEBUG', f'Circuit breaker: {self.breaker.snapshot()}')
+            yield attempt, timeout, delay
+
+    def sending(self):
+        # se cuenta antes de enviar: un request que da timeout también cuenta
+        self.metrics.inc('requests')
+
+    def classify(self, status_code, headers):
+        """
+        Qué hacer con la respuesta: RETRY_LATER (429), REFRESH_TOKEN (401) o
+        RESPONSE_OK (el resto; los errores HTTP los levanta raise_for_status).
+        """
+        metrics = self.metrics
+        # manejo de rate limits: el controlador baja la concurrencia y pausa todos
+        # los slots hasta Retry-After, en lugar de dormir solo este request
+        if status_code == 429:  # Too Many Requests
+            retry_after = int(headers.get('Retry-After', 60))
+            metrics.inc('throttled')
+            self.controller.on_throttle(retry_after)
+            metrics.log('WARNING', f'RATE LIMIT EXCEDIDO - Pausa de {retry_after}s y concurrencia a '
+                                   f'{self.controller.snapshot()["limit"]} (HTTP 429)')
+            return RETRY_LATER
+        if status_code == 401:
+            metrics.inc('unauthorized')
+            metrics.log('WARNING', 'Token expirado, refrescando...')
+            return REFRESH_TOKEN
+        return RESPONSE_OK
+
+    def token_refreshed(self):
+        self.metrics.inc('token_refreshes')
+        self.metrics.log('DEBUG', 'Token refrescado, reintentando...')
+
+    def succeeded(self, content, request_latency):
+        """
+        Respuesta 2xx: decodifica una sola vez desde los bytes crudos y registra el éxito.
+        """
+        metrics = self.metrics
+        with profile_phase('parse'):
+            data = qb_json.loads(content)
+        self.controller.on_success(request_latency)
+        metrics.inc('bytes_received', len(content))
+        if self.cache_key is not None:
+            self.client.cache.put(self.cache_key, content)
+
+        # ÉXITO - cierra el circuito (o confirma la prueba half-open)
+        self.breaker.record_success()
+        metrics.log('DEBUG', f'Página desde posición {self.start_position} obtenida correctamente')
+        return data
+
+    def failed(self, attempt, error):
+        """
+        Registra un intento fallido; lanza CircuitOpenError si este fallo abrió el circuito.
+        """
+        self.last_error = error
+        kind = classify_error(error, self.error_kinds)
+        counter, error_type = ERROR_KINDS[kind]
+        if kind == 'timeout':
+            self.controller.on_timeout()
+        self.metrics.inc(counter)
+        self.metrics.log('WARNING', f'{error_type} en intento {attempt + 1}: {error!r}')
+        _handle_failure(attempt, self.max_retries, self.breaker, error_type, self.metrics)
+
+    def give_up(self):
+        metrics = self.metrics
+        # todos los reintentos fallaron (solo 429 también cuenta como fallo para el breaker)
+        if self.last_error is None:
+            self.breaker.record_failure()
+        metrics.inc('failed_fetches')
+        metrics.log('ERROR', f'FALLO TOTAL: {self.max_retries} intentos agotados. '
+                             f'Fallos consecutivos: {self.breaker.snapshot()["consecutive_failures"]}')
+        # error explícito: el chunk queda como fallido en lugar de cortarse en silencio
+        raise RuntimeError(
+            f'FALLO TOTAL: {self.max_retries} intentos agotados en la página desde la posición {self.start_position}'
+        ) from self.last_error
+
+    def begin_speculative(self):
+        # prefetch: con el circuito no cerrado ni se intenta (no consume la prueba half-open)
+        if self.breaker.state != CLOSED:
+            self.metrics.inc('speculative_misses')
+            raise SpeculativeFetchError(f'circuito {self.breaker.state}')
+        self.sending()
+
+    def speculative_succeeded(self, status_code, content, request_latency):
+        if status_code != 200:
+            raise SpeculativeFetchError(f'HTTP {status_code}')
+        return self.succeeded(content, request_latency)
+
+    def speculative_missed(self, error):
+        """
+        Error del único intento de un prefetch: sin reintentos, sin refresh del
+        token y sin registrarlo en el breaker ni en el controlador.
+        """
+        self.metrics.inc('speculative_misses')
+        return error if isinstance(error, SpeculativeFetchError) else SpeculativeFetchError(repr(error))
+
+
+class QBClient:
+    """
+    Cliente del API de QuickBooks compartido por todas las entidades de un realm.
+
+    Una sola sesión HTTP (conexiones keep-alive reutilizadas), un solo access
+    token, el circuit breaker y el controlador AIMD del realm. Un 401 refresca el
+    token una vez para todos los hilos: los que tenían el token viejo toman el
+    nuevo en lugar de pedir otro. Con `cache` (PageCache) las páginas ya leídas
+    se sirven desde disco sin pasar por el API. `realm_name` elige los secretos
+    del realm (ver realm_secret); None es el realm por defecto.
+    """
+
+    def __init__(self, realm_id, access_token, base_url=QB_BASE_URL, token_url=QB_TOKEN_URL,
+                 minor_version=QB_MINOR_VERSION, base_timeout=60, controller=None, cache=None,
+                 realm_name=None):
+        if not base_url or not minor_version:
+            raise ValueError("Se requiere una URL base y el minor version")
+        self.realm_id = realm_id
+        self.realm_name = realm_name
+        self.base_url = base_url
+        self.token_url = token_url
+        self.minor_version = minor_version
+        self.base_timeout = base_timeout
+        self.cache = cache
+        self.breaker = get_breaker(f'quickbooks:{realm_id}')
+        # límite AIMD de requests en vuelo, compartido por realm
+        self.controller = controller or get_controller(f'quickbooks:{realm_id}')
+        self.session = requests.Session()
+        # tantas conexiones en el pool como requests en vuelo admite el controlador
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(self.controller.max_limit, 10))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._access_token = access_token
+        self._token_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    @property
+    def access_token(self):
+        return self._access_token
+
+    def refresh_access_token(self, stale_token=None):
+        """
+        Refresca el access token. Con `stale_token`, solo si nadie lo refrescó ya
+        desde que ese token falló. Devuelve True si hay un token nuevo en uso.
+        """
+        with self._token_lock:
+            if stale_token is not None and self._access_token != stale_token:
+                return True
+            new_access_token, new_refresh_token = _refrescar_access_token(self.token_url, self.session, self.realm_name)
+            if not new_access_token:
+                return False
+            self._access_token = new_access_token
+            return True
+
+    def query_url(self):
+        return f"{self.base_url.rstrip('/')}/v3/company/{self.realm_id}/query"
+
+    def _get(self, url, token, params, timeout):
+        headers = {
+            'Authorization': f'Bearer {token}',
+            'Accept': 'application/json',
+            'Content-Type': 'text/plain'
+        }
+        with self.controller.slot():
+            request_start = time.perf_counter()
+            with profile_phase('fetch'):
+                response = self.session.get(url, headers=headers, params=params, timeout=timeout)
+            return response, time.perf_counter() - request_start
+
+    def fetch_page(self, query, start_position=1, max_results=1000, metrics=None, speculative=False):
+        """
+        Una página de `query`. Las decisiones (caché, breaker, 429, 401,
+        reintentos, métricas) son las de PageFetch; acá solo va la I/O con
+        requests. Con `speculative` (prefetch) hace un solo intento y lanza
+        SpeculativeFetchError si falla, sin afectar el breaker ni el AIMD.
+        """
+        page = PageFetch(self, query, start_position, max_results, metrics, REQUESTS_ERROR_KINDS)
+        data = page.cached()
+        if data is not None:
+            return data
+
+        if speculative:
+            page.begin_speculative()
+            try:
+                response, request_latency = self._get(page.url, self._access_token, page.params, self.base_timeout)
+                return page.speculative_succeeded(response.status_code, response.content, request_latency)
+            except Exception as e:
+                raise page.speculative_missed(e) from e
+
+        page.begin()
+        for attempt, timeout, delay in page.attempts():
+            if delay:
+                time.sleep(delay)
+            try:
+                token = self._access_token
+                page.sending()
+                response, request_latency = self._get(page.url, token, page.params, timeout)
+
+                status = page.classify(response.status_code, response.headers)
+                if status == RETRY_LATER:
+                    continue  # Reintentar sin contar como fallo
+                if status == REFRESH_TOKEN:
+                    if not self.refresh_access_token(stale_token=token):
+                        raise ValueError("Error crítico: No se pudo refrescar el token")
+                    page.token_refreshed()
+                    page.sending()
+                    response, request_latency = self._get(page.url, self._access_token, page.params, timeout)
+
+                response.raise_for_status()
+                return page.succeeded(response.content, request_latency)
+
+            except Exception as e:
+                page.failed(attempt, e)
+
+        page.give_up()
+
+
+def _ingested_at_str(kwargs):
+    # timestamp de ingesta
+    ingested_at_utc = kwargs.get('execution_date', datetime.utcnow())
+
+    # Convertir a string si es datetime
+    if isinstance(ingested_at_utc, datetime):
+        return ingested_at_utc.isoformat() + 'Z'
+    return str(ingested_at_utc)
+
+
+def build_chunks(start_date_str, end_date_str, chunk_days=7):
+    """
+    Divide [fecha_inicio, fecha_fin] en ventanas de `chunk_days` días.
+    """
+    if not start_date_str or not end_date_str:
+        raise ValueError("Se requieren los parámetros 'fecha_inicio' y 'fecha_fin' en formato YYYY-MM-DD")
+
+    try:
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+    except ValueError as e:
+        raise ValueError(f"Formato de fecha inválido. Use YYYY-MM-DD: {e}")
+
+    if start_date > end_date:
+        raise ValueError("La fecha de inicio debe ser menor o igual a la fecha de fin")
+
+    chunks = []
+    current_date = start_date
+    chunk_number = 1
+
+    while current_date <= end_date:
+        chunk_end = min(current_date + timedelta(days=chunk_days - 1), end_date)
+        chunks.append(_window(chunk_number, current_date, chunk_end))
+        current_date = chunk_end + timedelta(days=1)
+        chunk_number += 1
+    return chunks
+
+
+def _window(chunk_number, start_date, end_date, attempt=0):
+    return {
+        'chunk_number': chunk_number,
+        'start_date': start_date,
+        'end_date': end_date,
+        'start_date_str': start_date.strftime('%Y-%m-%d'),
+        'end_date_str': end_date.strftime('%Y-%m-%d'),
+        'attempt': attempt,
+    }
+
+
+def split_window(chunk, parts=2):
+    """
+    Sub-ventanas contiguas de un chunk fallido para reintentarlo en pedazos más
+    chicos (un chunk de un día se reintenta entero). Conservan el número de chunk.
+    """
+    days = (chunk['end_date'] - chunk['start_date']).days + 1
+    size = max(1, -(-days // parts))
+    windows = []
+    current_date = chunk['start_date']
+    while current_date <= chunk['end_date']:
+        window_end = min(current_date + timedelta(days=size - 1), chunk['end_date'])
+        windows.append(_window(chunk['chunk_number'], current_date, window_end, chunk.get('attempt', 0) + 1))
+        current_date = window_end + timedelta(days=1)
+    return windows
+
+
+# las entidades de qb_full_sync escriben el mismo archivo desde hilos distintos
+_state_lock = threading.Lock()
+
+
+def load_state(state_path, name, default=None):
+    """
+    Estado guardado para `name` en el JSON `state_path` (un objeto por entidad).
+    """
+    try:
+        with open(state_path) as f:
+            return json.load(f).get(name, default)
+    except (OSError, ValueError):
+        return default
+
+
+def save_state(state_path, name, value):
+    """
+    Reemplaza el estado de `name`; un valor vacío lo borra del archivo.
+    """
+    with _state_lock:
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        if value:
+            state[name] = value
+        else:
+            state.pop(name, None)
+        os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+        tmp_path = state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, state_path)
+
+
+def load_failed_windows(state_path, name):
+    """
+    Ventanas que siguieron fallando en corridas anteriores para la entidad `name`.
+    """
+    return load_state(state_path, name, [])
+
+
+def save_failed_windows(state_path, name, windows):
+    """
+    Reemplaza las ventanas pendientes de `name` (lista vacía = ninguna pendiente).
+    """
+    save_state(state_path, name, windows)
+
+
+def _request_payload(client, query, start_position, max_results, fields, filter_field):
+    """
+    Descripción del request de una página que se guarda en request_payload.
+    """
+    # URL completa de la llamada API
+    paginated_query = f"{query} STARTPOSITION {start_position} MAXRESULTS {max_results}"
+    full_api_url = f"{client.query_url()}?query={paginated_query}&minorversion={client.minor_version}"
+    return {
+        'full_api_url': full_api_url,
+        'method': 'GET',
+        'headers': {
+            'Authorization': 'Bearer [HIDDEN]',
+            'Accept': 'application/json',
+            'Content-Type': 'text/plain'
+        },
+        'query_parameters': {
+            'query': paginated_query,
+            'minorversion': client.minor_version
+        },
+        'base_url': client.base_url,
+        'realm_id': client.realm_id,
+        'original_query': query,
+        'payload_schema': payload_schema(fields, filter_field)
+    }
+
+
+def iter_pages(client, query, start_position=1, max_results=100, metrics=None, prefetch=0):
+    """
+    Páginas de `query` en orden, como (start_position, data, seconds).
+
+    Con `prefetch` > 0 las siguientes `prefetch` páginas ya están pedidas en un
+    hilo aparte mientras el llamador procesa la actual, así la latencia de red
+    queda detrás del trabajo de CPU. El llamador corta con break al ver una
+    página incompleta; como el total no se conoce antes, por ventana se
+    descartan hasta `prefetch` pedidos de más (en chunks de una sola página,
+    el doble de requests: por eso es opcional).
+
+    Los pedidos adelantados son especulativos (un intento, fuera del breaker y
+    del AIMD); si uno falla, la página se vuelve a pedir normalmente al llegar
+    a ella. Cerrar el generador (close) cancela los que no empezaron y espera
+    a los que están en vuelo, para que ninguno quede corriendo tras el chunk.
+    """
+    def fetch(position, speculative=False):
+        started = time.perf_counter()
+        data = client.fetch_page(query, start_position=position, max_results=max_results, metrics=metrics,
+                                 speculative=speculative)
+        return data, time.perf_counter() - started
+
+    if prefetch <= 0:
+        position = start_position
+        while True:
+            data, seconds = fetch(position)
+            yield position, data, seconds
+            position += max_results
+
+    executor = ThreadPoolExecutor(max_workers=prefetch, thread_name_prefix='qb-prefetch')
+    in_flight = deque()
+    next_position = start_position
+    try:
+        while True:
+            # la página actual más `prefetch` siguientes, siempre en vuelo
+            while len(in_flight) <= prefetch:
+                # la primera página se pide por el camino normal; las demás, por adelantado
+                future = executor.submit(contextvars.copy_context().run, fetch, next_position, bool(in_flight))
+                in_flight.append((next_position, future))
+                next_position += max_results
+            position, future = in_flight.popleft()
+            try:
+                data, seconds = future.result()
+            except SpeculativeFetchError:
+                data, seconds = fetch(position)
+            yield position, data, seconds
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+class ChunkPages:
+    """
+    Recorrido de las páginas de un chunk, sin I/O: query de la ventana, dónde
+    empezar (o retomar), guardar cada página en chunk['frame_builder'] y cuándo
+    parar. qb_sync._fetch_chunk (hilos) y qb_async._fetch_chunk (asyncio) solo
+    traen las páginas con su iter_pages.
+    """
+
+    max_results = 100
+
+    def __init__(self, client, chunk, qb_entity, fields, ingested_at_utc_str, metrics, total_chunks, deadline=None):
+        self.client = client
+        self.chunk = chunk
+        self.qb_entity = qb_entity
+        self.fields = fields
+        self.ingested_at_utc_str = ingested_at_utc_str
+        self.metrics = metrics
+        self.deadline = deadline
+        self.started_at = time.time()
+        metrics.log('DEBUG', f'\nPROCESANDO CHUNK {chunk["chunk_number"]}/{total_chunks}')
+        metrics.log('DEBUG', f'Fechas procesadas: {chunk["start_date_str"]} a {chunk["end_date_str"]}')
+
+        chunk.setdefault('frame_builder', PageFrameBuilder())
+        # query para el chunk actual
+        self.start_utc = f"{chunk['start_date_str']}T00:00:00Z"
+        self.end_utc = f"{chunk['end_date_str']}T23:59:59Z"
+        self.query = build_entity_query(qb_entity.entity, qb_entity.filter_field, self.start_utc, self.end_utc, fields)
+
+        # páginas para este chunk (los contadores se acumulan si el chunk se retoma)
+        chunk.setdefault('records', 0)
+        chunk.setdefault('pages', 0)
+        self.start_position = chunk.get('resume_position', 1)
+        self.page_number = chunk.get('resume_page', 1)
+
+    def circuit_opened(self):
+        # retomar desde la página que faltaba cuando el breaker vuelva a admitir requests
+        self.chunk['resume_position'] = self.start_position
+        self.chunk['resume_page'] = self.page_number
+
+    def store(self, start_position, data, page_duration):
+        """
+        Agrega una página al PageFrameBuilder del chunk. Devuelve False si no hay
+        que pedir más páginas (página vacía o incompleta, o se pasó el plazo).
+        """
+        chunk, qb_entity, metrics = self.chunk, self.qb_entity, self.metrics
+        page_number = self.page_number
+        if not data or 'QueryResponse' not in data:
+            metrics.log('DEBUG', f'  No se encontraron más datos en página {page_number}')
+            return False
+
+        query_response = data['QueryResponse']
+
+        if qb_entity.entity not in query_response:
+            metrics.log('DEBUG', f'  No se encontraron {qb_entity.name} en página {page_number}')
+            return False
+
+        records = query_response[qb_entity.entity]
+        metrics.observe_page(page_duration, len(records))
+
+        # Metadatos comunes de la página (una vez por página, no por registro)
+        with profile_phase('frame_build'):
+            chunk['frame_builder'].add_page(
+                records,
+                ingested_at_utc=self.ingested_at_utc_str,
+                extract_window_start_utc=self.start_utc,
+                extract_window_end_utc=self.end_utc,
+                page_number=page_number,
+                request_payload=_request_payload(self.client, self.query, start_position, self.max_results,
+                                                 self.fields, qb_entity.filter_field),
+                realm_id=self.client.realm_id,
+            )
+
+        chunk['records'] += len(records)
+        chunk['pages'] += 1
+
+        metrics.log('DEBUG', f'  Página {page_number}: {len(records)} {qb_entity.name} en {page_duration:.2f}s')
+
+        # si recibimos menos registros de los solicitados, es la última página
+        if len(records) < self.max_results:
+            return False
+
+        # avanzar a la siguiente página
+        self.start_position = start_position + self.max_results
+        self.page_number += 1
+
+        # sin tiempo: cortar después de la página ya guardada
+        if self.deadline is not None and time.time() >= self.deadline:
+            chunk['interrupted'] = True
+            return False
+        return True
+
+    def finish(self):
+        self.chunk['seconds'] = self.chunk.get('seconds', 0) + time.time() - self.started_at
+
+
+def _fetch_chunk(client, chunk, qb_entity, fields, ingested_at_utc_str, metrics, total_chunks, prefetch=0,
+                 deadline=None):
+    """
+    Lee todas las páginas de un chunk en su propio PageFrameBuilder (chunk['frame_builder']).
+
+    Corre en un hilo del pool de sync_entity; las páginas llegan de iter_pages
+    con `prefetch` páginas pedidas por adelantado. Si el circuito se abre a
+    mitad de camino, deja en el chunk la posición y página donde retomar y
+    propaga CircuitOpenError; las páginas ya leídas quedan en su builder.
+    Pasado `deadline` (time.time()) termina la página en curso, marca el chunk
+    como interrumpido y vuelve.
+    """
+    chunk_pages = ChunkPages(client, chunk, qb_entity, fields, ingested_at_utc_str, metrics, total_chunks, deadline)
+    pages = iter_pages(client, chunk_pages.query, start_position=chunk_pages.start_position,
+                       max_results=chunk_pages.max_results, metrics=metrics, prefetch=prefetch)
+    try:
+        while True:
+            # página actual (la siguiente ya puede estar en camino)
+            try:
+                start_position, data, page_duration = next(pages)
+            except CircuitOpenError:
+                chunk_pages.circuit_opened()
+                raise
+            if not chunk_pages.store(start_position, data, page_duration):
+                break
+    finally:
+        pages.close()
+        chunk_pages.finish()
+
+    return chunk
+
+
+class EntitySync:
+    """
+    Estado de la sincronización de una entidad: configuración tomada de los
+    kwargs del bloque, chunks a procesar, progreso y ventanas fallidas.
+
+    sync_entity (hilos) y qb_async.sync_entity_async (asyncio) solo difieren
+    en cómo leen los chunks; ambos reportan el resultado de cada uno acá
+    (chunk_completed, defer, chunk_failed, chunk_interrupted, postpone) y
+    cierran con finish().
+
+    Con time_budget_seconds, al vencer el plazo no se empiezan más chunks; las
+    ventanas sin terminar quedan en un checkpoint y la corrida termina con
+    estado 'partial'. La siguiente corrida del mismo rango retoma solo esas.
+    """
+
+    def __init__(self, client, qb_entity, kwargs):
+        self.client = client
+        self.qb_entity = qb_entity
+        self.label = qb_entity.name
+        self.entity = qb_entity.entity
+        # en corridas multi-realm las ventanas fallidas y las métricas van por realm
+        self.realm_name = client.realm_name
+        self.state_key = self.label if self.realm_name is None else f'{self.realm_name}:{self.label}'
+        self.start_date_str = kwargs.get('fecha_inicio')
+        self.end_date_str = kwargs.get('fecha_fin')
+        self.chunk_days = kwargs.get('chunk_days', 7)
+        # proyección de campos: payload parcial, respuestas más chicas
+        self.fields = resolve_fields(kwargs.get('qb_fields'), self.entity)
+        # métricas de la corrida; los logs detallados quedan detrás de log_level
+        self.metrics = QBMetrics(self.entity, run_id=kwargs.get('metrics_run_id'),
+                                 log_level=kwargs.get('log_level', 'INFO'), realm=self.realm_name)
+        self.metrics_dir = kwargs.get('metrics_dir', os.path.join(get_repo_path(), 'metrics', 'qb'))
+
+        # variables de recuperacion
+        self.resume_mode = kwargs.get('resume_mode', True)  # Retomar el checkpoint de una corrida parcial del mismo rango
+        self.retry_failed_chunks = kwargs.get('retry_failed_chunks', True)  # Reintentar fallos al final de la corrida
+        self.max_chunk_retries = kwargs.get('max_chunk_retries', 2)  # Reintentos por chunk, cada uno en sub-ventanas más chicas
+        self.retry_backoff_seconds = kwargs.get('retry_backoff_seconds', 5)  # Espera antes del primer reintento (se duplica)
+        # None: no leer ni guardar ventanas fallidas (p. ej. bloques dinámicos, que reintenta Mage)
+        self.failed_chunks_path = kwargs.get('failed_chunks_path', os.path.join(get_repo_path(), '.variables', 'qb_failed_chunks.json'))
+        self.fail_on_chunk_errors = kwargs.get('fail_on_chunk_errors', False)  # Fallar el bloque si quedan chunks fallidos
+        self.retry_saved_chunks = kwargs.get('retry_saved_chunks', True)  # Reprocesar ventanas fallidas de corridas anteriores
+        self.verify_only = kwargs.get('verify_only', False)  # True para solo verificar sin procesar
+        self.skip_chunks = kwargs.get('skip_chunks', [])  # Lista de números de chunk a omitir
+        self.force_chunks = kwargs.get('force_chunks', [])  # Lista de números de chunk a forzar reproceso
+        self.max_circuit_deferrals = kwargs.get('max_circuit_deferrals', 3)  # Veces que un chunk se difiere por circuito abierto
+        self.max_concurrency = kwargs.get('max_concurrency', 4)
+        self.prefetch_pages = kwargs.get('prefetch_pages', 0)  # Páginas pedidas por adelantado dentro de cada chunk
+        # plazo de la corrida (time.time()); run_sync lo fija una vez para todos los realms y entidades
+        self.time_budget_seconds = kwargs.get('time_budget_seconds')
+        self.deadline = kwargs.get('time_budget_deadline') or (
+            time.time() + self.time_budget_seconds if self.time_budget_seconds else None
+        )
+        # None: sin checkpoint (p. ej. bloques dinámicos)
+        self.checkpoint_path = kwargs.get('checkpoint_path', os.path.join(get_repo_path(), '.variables', 'qb_checkpoints.json'))
+
+        print(f"CONFIGURACIÓN DE PROCESAMIENTO ({self.entity}, realm {client.realm_id})")
+        print(f"Resume mode: {'ACTIVADO' if self.resume_mode else 'DESACTIVADO'}")
+        print(f"Retry failed chunks: {'ACTIVADO' if self.retry_failed_chunks else 'DESACTIVADO'}")
+        print(f"Verify only: {'Solo verificación' if self.verify_only else 'Procesamiento normal'}")
+        print(f"Skip chunks: {self.skip_chunks if self.skip_chunks else 'Ninguno'}")
+        print(f"Force chunks: {self.force_chunks if self.force_chunks else 'Ninguno'}")
+        print(f"Campos: {', '.join(payload_schema(self.fields, qb_entity.filter_field)['fields']) if self.fields else 'Todos (select *)'}")
+        print(f"Time budget: {f'{self.time_budget_seconds}s' if self.time_budget_seconds else 'Sin límite'}")
+
+        self.chunks = build_chunks(self.start_date_str, self.end_date_str, self.chunk_days)
+        self.ingested_at_utc_str = _ingested_at_str(kwargs)
+
+        print(f'INICIO DEL BACKFILL DE QB {self.label.upper()}')
+        print(f'Rango completo: {self.start_date_str} a {self.end_date_str}')
+        print(f'Chunk size: {self.chunk_days} días')
+        print(f'Ingested at: {self.ingested_at_utc_str}')
+        print(f'Total de chunks a procesar: {len(self.chunks)}')
+
+        # tracking de progreso y recuperacion
+        self.progress_tracker = {
+            'run_id': f"{self.start_date_str}_{self.end_date_str}_{self.chunk_days}d_{self.ingested_at_utc_str.split('T')[0]}",
+            'total_chunks': len(self.chunks),
+            'completed_chunks': [],
+            'failed_chunks': [],
+            'skipped_chunks': list(self.skip_chunks),
+            'processing_start': datetime.utcnow().isoformat() + 'Z'
+        }
+
+        # checkpoint de una corrida parcial anterior con el mismo rango
+        self.run_signature = f"{self.start_date_str}_{self.end_date_str}_{self.chunk_days}d"
+        self.checkpoint = None
+        saved_checkpoint = load_state(self.checkpoint_path, self.state_key) if self.checkpoint_path else None
+        if saved_checkpoint and self.resume_mode and saved_checkpoint.get('run') == self.run_signature:
+            self.checkpoint = saved_checkpoint
+            print(f"[RESUME] Corrida parcial del {saved_checkpoint['saved_at']}: "
+                  f"{len(saved_checkpoint['completed_chunks'])} chunks completos, "
+                  f"{len(saved_checkpoint['pending'])} ventanas pendientes")
+        elif saved_checkpoint:
+            print(f"Checkpoint de {saved_checkpoint.get('run')} ignorado "
+                  f"({'resume_mode desactivado' if not self.resume_mode else 'otro rango'})")
+
+        # resume/retry
+        self.chunks_to_process = []
+        for chunk in self.chunks:
+            chunk_num = chunk['chunk_number']
+
+            # Verificar si saltar este chunk
+            if chunk_num in self.skip_chunks:
+                print(f"Saltando chunk {chunk_num} (en skip_chunks)")
+                continue
+
+            # Verificar si forzar reproceso
+            if self.force_chunks and chunk_num in self.force_chunks:
+                print(f"Forzando reproceso del chunk {chunk_num}")
+                self.chunks_to_process.append(chunk)
+                continue
+
+            # modo verify_only, solo mostrar qué se haría
+            if self.verify_only:
+                print(f"[VERIFY] Chunk {chunk_num}: {chunk['start_date_str']} a {chunk['end_date_str']}")
+                continue
+
+            # retomando: solo las ventanas pendientes del checkpoint (abajo)
+            if self.checkpoint is not None:
+                continue
+
+            self.chunks_to_process.append(chunk)
+
+        if self.checkpoint is not None:
+            for pending in self.checkpoint['pending']:
+                chunk = _window(
+                    pending['chunk_number'],
+                    datetime.strptime(pending['start_date'], '%Y-%m-%d').date(),
+                    datetime.strptime(pending['end_date'], '%Y-%m-%d').date(),
+                    pending.get('attempt', 0),
+                )
+                if chunk['chunk_number'] in self.skip_chunks or chunk['chunk_number'] in self.force_chunks:
+                    continue
+                print(f"[RESUME] Chunk {chunk['chunk_number']} pendiente: {chunk['start_date_str']} a {chunk['end_date_str']}")
+                if not self.verify_only:
+                    self.chunks_to_process.append(chunk)
+
+        # ventanas que quedaron fallidas en corridas anteriores: se suman a esta corrida
+        self.saved_windows = load_failed_windows(self.failed_chunks_path, self.state_key) if self.failed_chunks_path else []
+        if self.saved_windows and self.retry_saved_chunks:
+            for offset, saved in enumerate(self.saved_windows, start=1):
+                chunk = _window(
+                    len(self.chunks) + offset,
+                    datetime.strptime(saved['start_date'], '%Y-%m-%d').date(),
+                    datetime.strptime(saved['end_date'], '%Y-%m-%d').date(),
+                )
+                print(f"{'[VERIFY] ' if self.verify_only else ''}Ventana fallida en una corrida anterior: "
+                      f"{chunk['start_date_str']} a {chunk['end_date_str']} (chunk {chunk['chunk_number']})")
+                if not self.verify_only:
+                    self.chunks_to_process.append(chunk)
+
+        if self.verify_only:
+            print(f"\nVERIFICACIÓN COMPLETADA")
+            print(f"Total chunks definidos: {len(self.chunks)}")
+            print(f"Chunks a saltar: {len(self.skip_chunks)}")
+            print(f"Chunks a forzar: {len(self.force_chunks)}")
+            print(f"Chunks que se procesarían: {len(self.chunks_to_process)}")
+            return
+
+        print(f"RESUMEN DE PROCESAMIENTO:")
+        print(f"  Total chunks definidos: {len(self.chunks)}")
+        print(f"  Chunks a procesar: {len(self.chunks_to_process)}")
+        print(f"  Chunks a saltar: {len(self.skip_chunks)}")
+        print(f"  Chunks forzados: {len(self.force_chunks) if self.force_chunks else 0}")
+
+        self.total_records = 0
+        self.total_pages = 0
+        # todos los chunks y sub-ventanas leídos, para juntar sus páginas al final
+        self.all_chunks = list(self.chunks_to_process)
+        # ventanas que quedan para la próxima corrida por falta de tiempo
+        self.pending_windows = []
+
+    def out_of_time(self):
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def wait_seconds(self, seconds):
+        # una espera (backoff, circuito abierto) nunca pasa del plazo
+        if self.deadline is None:
+            return seconds
+        return max(0.0, min(seconds, self.deadline - time.time()))
+
+    def postpone(self, chunks):
+        """
+        Ventanas que no se llegaron a leer: al checkpoint, para la próxima corrida.
+        """
+        for chunk in chunks:
+            self.pending_windows.append({
+                'chunk_number': chunk['chunk_number'],
+                'start_date': chunk['start_date_str'],
+                'end_date': chunk['end_date_str'],
+                'attempt': chunk['attempt'],
+            })
+        if chunks:
+            self.metrics.log('WARNING', f'TIME BUDGET AGOTADO ({self.entity}): {len(chunks)} ventanas '
+                                        f'quedan para la próxima corrida')
+
+    def chunk_interrupted(self, chunk):
+        """
+        Chunk cortado por el plazo después de una página completa. Sus páginas se
+        exportan; la ventana entera queda pendiente y se relee desde la primera
+        página (entre corridas los datos pueden moverse de página).
+        """
+        self.metrics.inc('interrupted_chunks')
+        self.total_records += chunk['records']
+        self.total_pages += chunk['pages']
+        self.metrics.observe_chunk(chunk['chunk_number'], chunk['start_date_str'], chunk['end_date_str'],
+                                   chunk['records'], chunk['pages'], chunk['seconds'], status='interrupted')
+        self.metrics.log('WARNING', f"CHUNK {chunk['chunk_number']} INTERRUMPIDO por time_budget_seconds tras "
+                                    f"{chunk['pages']} páginas ({chunk['records']} filas)")
+        self.postpone([chunk])
+
+    def retry_delay(self, chunk):
+        return self.retry_backoff_seconds * 2 ** (chunk['attempt'] - 1)
+
+    def defer(self, chunk, open_error):
+        """
+        Circuito abierto a mitad del chunk: True si el chunk puede volver a la
+        cola (retoma desde la página que faltaba tras open_error.retry_after).
+        """
+        chunk['deferrals'] = chunk.get('deferrals', 0) + 1
+        if chunk['deferrals'] <= self.max_circuit_deferrals:
+            self.metrics.inc('deferred_chunks')
+            self.metrics.log('WARNING', f'CHUNK {chunk["chunk_number"]} DIFERIDO ({chunk["deferrals"]}/{self.max_circuit_deferrals}): '
+                                        f'{open_error}. Se retoma desde la página {chunk["resume_page"]}')
+            return True
+        self.metrics.log('ERROR', f'CHUNK {chunk["chunk_number"]}: circuito abierto tras {self.max_circuit_deferrals} intentos diferidos')
+        return False
+
+    def log_chunk_error(self, chunk, error):
+        # Manejo de errores de chunk completo
+        self.metrics.log('ERROR', f'\nERROR EN CHUNK {chunk["chunk_number"]} ({self.entity})')
+        self.metrics.log('ERROR', f'Fechas afectadas: {chunk["start_date_str"]} a {chunk["end_date_str"]}')
+        self.metrics.log('ERROR', f'Error: {str(error)}')
+
+    def chunk_failed(self, chunk, chunk_error):
+        """
+        Devuelve las sub-ventanas a reintentar, o [] si el chunk queda fallido
+        (se guarda para la próxima corrida).
+        """
+        # las páginas ya leídas quedan en el builder del chunk; el dedup por id
+        # descarta las que la sub-ventana vuelva a traer
+        if self.retry_failed_chunks and chunk['attempt'] < self.max_chunk_retries:
+            sub_windows = split_window(chunk)
+            self.all_chunks.extend(sub_windows)
+            self.metrics.inc('retried_chunks')
+            self.metrics.log('WARNING', f"Chunk {chunk['chunk_number']} a la cola de reintentos en {len(sub_windows)} "
+                                        f"sub-ventanas (reintento {chunk['attempt'] + 1}/{self.max_chunk_retries})")
+            return sub_windows
+
+        self.metrics.observe_chunk(chunk['chunk_number'], chunk['start_date_str'], chunk['end_date_str'],
+                                   chunk.get('records', 0), chunk.get('pages', 0), chunk.get('seconds', 0),
+                                   status='failed', error=str(chunk_error))
+
+        # Marcar chunk como fallido; se guarda para la próxima corrida
+        self.progress_tracker['failed_chunks'].append({
+            'chunk_number': chunk['chunk_number'],
+            'date_range': f"{chunk['start_date_str']} a {chunk['end_date_str']}",
+            'start_date': chunk['start_date_str'],
+            'end_date': chunk['end_date_str'],
+            'attempts': chunk['attempt'] + 1,
+            'error': str(chunk_error),
+            'duration': chunk.get('seconds', 0)
+        })
+        self.metrics.log('ERROR', f"CHUNK {chunk['chunk_number']} FALLIDO ({chunk['start_date_str']} a "
+                                  f"{chunk['end_date_str']}): se guarda para la próxima corrida")
+        return []
+
+    def chunk_completed(self, chunk):
+        chunk_records = chunk['records']
+        chunk_pages = chunk['pages']
+        chunk_duration = chunk['seconds']
+
+        # Actualizar totales
+        self.total_records += chunk_records
+        self.total_pages += chunk_pages
+
+        # Marcar chunk como completado exitosamente
+        self.progress_tracker['completed_chunks'].append(chunk['chunk_number'])
+        self.metrics.observe_chunk(chunk['chunk_number'], chunk['start_date_str'], chunk['end_date_str'],
+                                   chunk_records, chunk_pages, chunk_duration)
+
+        # LOGS DEL TRAMO COMPLETADO
+        metrics = self.metrics
+        metrics.log('INFO', f'{self.entity} CHUNK {chunk["chunk_number"]}/{len(self.chunks)} COMPLETADO: '
+                            f'{chunk["start_date_str"]} a {chunk["end_date_str"]}, {chunk_pages} páginas, '
+                            f'{chunk_records} filas en {chunk_duration:.2f}s (concurrencia {self.client.controller.limit})')
+        metrics.log('DEBUG', f'Promedio por página: {chunk_duration/max(chunk_pages, 1):.2f} segundos')
+        metrics.log('DEBUG', f'Velocidad de ingesta: {chunk_records/max(chunk_duration, 0.1):.2f} {self.label}/segundo')
+        metrics.log('DEBUG', f'Progreso general: {len(self.progress_tracker["completed_chunks"])}/{len(self.chunks)} chunks')
+        metrics.log('DEBUG', f'Total acumulado hasta ahora: {self.total_records} {self.label} en {self.total_pages} páginas')
+        metrics.log('DEBUG', '-' * 60)
+
+    def finish(self):
+        """
+        Junta las páginas de todos los chunks, guarda las ventanas fallidas y
+        las métricas, y devuelve el DataFrame raw deduplicado por id.
+        """
+        if self.verify_only:
+            return pd.DataFrame()  # DataFrame vacío en modo verificación
+
+        metrics = self.metrics
+        # Acumulador columnar en orden de chunk (los chunks terminan en cualquier orden);
+        # incluye las páginas leídas por chunks que fallaron a mitad de camino
+        frame_builder = PageFrameBuilder()
+        for chunk in sorted(self.all_chunks, key=lambda c: (c['chunk_number'], c['attempt'], c['start_date'])):
+            if 'frame_builder' in chunk:
+                frame_builder.extend(chunk.pop('frame_builder'))
+
+        # ventanas que siguen fallando: reemplazan a las guardadas si esta corrida las reprocesó
+        failed_windows = [
+            {'start_date': failed['start_date'], 'end_date': failed['end_date'],
+             'attempts': failed['attempts'], 'error': failed['error'],
+             'failed_at': datetime.utcnow().isoformat() + 'Z'}
+            for failed in self.progress_tracker['failed_chunks']
+        ]
+        if not self.retry_saved_chunks:
+            failed_windows = self.saved_windows + failed_windows
+        # ventanas guardadas de corridas anteriores que no alcanzaron a leerse: siguen
+        # en el archivo de fallidas; el checkpoint solo lleva las del rango de la corrida
+        pending_windows = [w for w in self.pending_windows if w['chunk_number'] <= len(self.chunks)]
+        failed_windows += [
+            {'start_date': window['start_date'], 'end_date': window['end_date'],
+             'attempts': window['attempt'], 'error': 'sin leer: se agotó time_budget_seconds',
+             'failed_at': datetime.utcnow().isoformat() + 'Z'}
+            for window in self.pending_windows if window['chunk_number'] > len(self.chunks)
+        ]
+        if self.failed_chunks_path:
+            try:
+                save_failed_windows(self.failed_chunks_path, self.state_key, failed_windows)
+            except OSError as e:
+                print(f"No se pudieron guardar las ventanas fallidas en {self.failed_chunks_path}: {e}")
+            if failed_windows:
+                print(f"Ventanas fallidas pendientes para la próxima corrida: {len(failed_windows)} -> {self.failed_chunks_path}")
+        metrics.set_info('failed_windows', failed_windows)
+
+        # checkpoint: ventanas pendientes si la corrida fue parcial; se borra al completar el rango
+        status = 'partial' if self.pending_windows else 'complete'
+        completed_chunks = sorted(set(self.progress_tracker['completed_chunks']).union(
+            self.checkpoint['completed_chunks'] if self.checkpoint else []
+        ))
+        if self.checkpoint_path:
+            checkpoint = {
+                'run': self.run_signature,
+                'status': status,
+                'completed_chunks': completed_chunks,
+                'pending': pending_windows,
+                'saved_at': datetime.utcnow().isoformat() + 'Z',
+            } if pending_windows else None
+            try:
+                save_state(self.checkpoint_path, self.state_key, checkpoint)
+            except OSError as e:
+                print(f"No se pudo guardar el checkpoint en {self.checkpoint_path}: {e}")
+        metrics.set_info('status', status)
+        metrics.set_info('pending_windows', self.pending_windows)
+
+        metrics.set_info('concurrency', self.client.controller.snapshot())
+        if self.client.cache is not None:
+            metrics.set_info('cache', self.client.cache.snapshot())
+
+        if status == 'partial':
+            print(f'\nBACKFILL PARCIAL ({self.entity}): se agotó time_budget_seconds')
+            print(f'Ventanas pendientes: {len(pending_windows)} -> {self.checkpoint_path}; '
+                  f're-ejecutar con el mismo rango para continuar')
+        else:
+            print(f'\nBACKFILL COMPLETADO ({self.entity})')
+        print(f'Total chunks procesados: {len(self.chunks)}')
+        print(f'Total páginas: {self.total_pages}')
+        print(f'Rango procesado: {self.start_date_str} a {self.end_date_str}')
+
+        # Crear DataFrame final (columnas ya en el orden de RAW_COLUMNS)
+        with profile_phase('frame_build'):
+            df = frame_builder.build()
+
+        # eliminar duplicados: un registro puede caer en dos rangos de fecha de consultas
+        if not df.empty:
+            with profile_phase('dedup'):
+                df = df.drop_duplicates(subset=['realm_id', 'id'], keep='first')  # Mantener la primera ocurrencia
+
+        print(f'Total {self.label}(luego de eliminar duplicados): {len(df)}')
+
+        # resumen de métricas de la corrida (JSON + formato Prometheus)
+        try:
+            json_path, prom_path = metrics.write(self.metrics_dir)
+            summary = metrics.summary()
+            print(f"Métricas: {summary['counters']['pages']} páginas, {summary['counters']['retries']} reintentos, "
+                  f"p99 por página {summary['page_latency_seconds'].get('p99', 0)}s -> {json_path}, {prom_path}")
+        except OSError as e:
+            print(f"No se pudieron escribir las métricas en {self.metrics_dir}: {e}")
+
+        failed_chunks = self.progress_tracker['failed_chunks']
+        if self.fail_on_chunk_errors and failed_chunks:
+            raise RuntimeError(
+                f"{len(failed_chunks)} chunks de {self.entity} fallaron: "
+                + ', '.join(failed['date_range'] for failed in failed_chunks)
+            )
+
+        return df
+
+
+def sync_entity(client, qb_entity, **kwargs):
+    """
+    Backfill de una entidad por chunks de fechas, leídos en paralelo con `client`.
+
+    Recibe los kwargs del bloque (fecha_inicio, fecha_fin, chunk_days, qb_fields,
+    log_level, metrics_dir, resume_mode, retry_failed_chunks, max_chunk_retries,
+    retry_backoff_seconds, failed_chunks_path, retry_saved_chunks, verify_only,
+    skip_chunks, force_chunks, max_circuit_deferrals, max_concurrency, prefetch_pages,
+    time_budget_seconds, checkpoint_path; ver run_sync) y devuelve el
+    DataFrame raw deduplicado por id (parcial si se agotó el plazo).
+    """
+    run = EntitySync(client, qb_entity, kwargs)
+    if run.verify_only:
+        return run.finish()
+
+    # cola de chunks leídos en paralelo (cada chunk pagina en orden). Con el circuito
+    # abierto el chunk vuelve a la cola hasta que el breaker admita una prueba y
+    # retoma desde la página que faltaba, en lugar de dormir o cortarse.
+    # Un chunk que falla pasa a retry_queue partido en sub-ventanas; la cola se
+    # drena al terminar la pasada, con backoff, sin repetir los chunks que salieron bien.
+    # Vencido time_budget_seconds, lo que no empezó pasa al checkpoint y se
+    # espera solo a los chunks en vuelo, que cortan tras su página en curso.
+    max_concurrency = run.max_concurrency
+    pending_chunks = list(run.chunks_to_process)
+    retry_queue = []
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        while pending_chunks or running or retry_queue:
+            if run.out_of_time() and (pending_chunks or retry_queue):
+                run.postpone(pending_chunks + retry_queue)
+                pending_chunks.clear()
+                retry_queue.clear()
+                continue
+
+            if not pending_chunks and not running:
+                for chunk in retry_queue:
+                    chunk['not_before'] = time.time() + run.retry_delay(chunk)
+                run.metrics.log('WARNING', f'REINTENTANDO {len(retry_queue)} sub-ventanas de chunks fallidos ({run.entity})')
+                pending_chunks.extend(retry_queue)
+                retry_queue.clear()
+
+            now = time.time()
+            ready = [chunk for chunk in pending_chunks if chunk.get('not_before', 0) <= now]
+            for chunk in ready[:max_concurrency - len(running)]:
+                pending_chunks.remove(chunk)
+                # copiar el contexto para que profile_phase funcione en los hilos del pool
+                future = executor.submit(
+                    contextvars.copy_context().run, _fetch_chunk, client, chunk, qb_entity,
+                    run.fields, run.ingested_at_utc_str, run.metrics, len(run.chunks), run.prefetch_pages,
+                    run.deadline,
+                )
+                running[future] = chunk
+
+            if not running:
+                # solo quedan chunks diferidos o reintentos en backoff: esperar al primero
+                time.sleep(run.wait_seconds(min(chunk['not_before'] for chunk in pending_chunks) - now))
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk = running.pop(future)
+                try:
+                    future.result()
+
+                except CircuitOpenError as open_error:
+                    if run.defer(chunk, open_error):
+                        chunk['not_before'] = time.time() + open_error.retry_after
+                        pending_chunks.append(chunk)
+                        continue
+                    retry_queue.extend(run.chunk_failed(chunk, open_error))
+
+                except Exception as error:
+                    run.log_chunk_error(chunk, error)
+                    retry_queue.extend(run.chunk_failed(chunk, error))
+
+                else:
+                    if chunk.get('interrupted'):
+                        run.chunk_interrupted(chunk)
+                    else:
+                        run.chunk_completed(chunk)
+
+    return run.finish()
+
+
+def plan_chunks(entity_names, start_date_str, end_date_str, chunk_days=7, realm_names=None):
+    """
+    Lista plana de (realm, entidad, ventana) para repartir un backfill en bloques
+    dinámicos de Mage: un bloque hijo por chunk. Sin `realm_names`, solo el
+    realm por defecto (los items no llevan 'realm').
+    """
+    plan = []
+    for realm_name in realm_names or [None]:
+        for name in entity_names:
+            get_entity(name)
+            for chunk in build_chunks(start_date_str, end_date_str, chunk_days):
+                item = {} if realm_name is None else {'realm': realm_name}
+                plan.append({
+                    **item,
+                    'entity': name,
+                    'chunk_number': chunk['chunk_number'],
+                    'start_date': chunk['start_date_str'],
+                    'end_date': chunk['end_date_str'],
+                })
+    return plan
+
+
+def _sync_realm(client_options, qb_entities, kwargs):
+    """
+    Todas las entidades de un realm con un solo QBClient, una entidad por hilo.
+    Devuelve {nombre de la entidad: DataFrame raw}.
+    """
+    with QBClient(**client_options) as client:
+        print(f"REFRESCANDO TOKEN (realm {client.realm_id})")
+        if client.refresh_access_token():
+            print(f"Token refrescado con exito")
+        else:
+            print("Error al regrescar el token, puede estar expirado")
+
+        if len(qb_entities) == 1:
+            return {qb_entities[0].name: sync_entity(client, qb_entities[0], **kwargs)}
+
+        print(f"SINCRONIZANDO EN PARALELO: {', '.join(qb_entity.name for qb_entity in qb_entities)}")
+        with ThreadPoolExecutor(max_workers=len(qb_entities)) as executor:
+            futures = {
+                qb_entity.name: executor.submit(
+                    contextvars.copy_context().run, sync_entity, client, qb_entity, **kwargs,
+                )
+                for qb_entity in qb_entities
+            }
+    return _collect(futures)
+
+
+def _collect(futures):
+    # resultados de {nombre: future}; si alguno falló, un solo error con todos
+    errors = {name: future.exception() for name, future in futures.items() if future.exception()}
+    if errors:
+        raise RuntimeError(
+            f"Falló la sincronización de: {', '.join(f'{name} ({error})' for name, error in errors.items())}"
+        ) from next(iter(errors.values()))
+    return {name: future.result() for name, future in futures.items()}
+
+
+def run_sync(entity_names, **kwargs):
+    """
+    Sincroniza varias entidades a la vez con un solo cliente por realm: un
+    refresh de token, una sesión HTTP y un límite de concurrencia por realm.
+    Cada entidad corre en su propio hilo, así que la corrida completa dura lo
+    que la entidad más lenta y no la suma. Con qb_client='async' todo corre en
+    un event loop con AsyncQBClient (scheduler.utils.qb_async).
+
+    Con qb_realms se sincronizan varias compañías (realms) a la vez, cada una
+    con sus credenciales, su circuit breaker y su controlador AIMD (los límites
+    del API de QuickBooks son por realm). Las filas llevan realm_id, parte de
+    la clave (realm_id, id) de las tablas raw.
+
+    Con time_budget_seconds el plazo es uno para toda la corrida: al vencer,
+    cada entidad termina su página en curso, devuelve lo leído y deja las
+    ventanas pendientes en checkpoint_path (ver EntitySync).
+
+    Es la referencia única de los kwargs de los bloques de ingesta QB
+    (ingest_qb_invoices, ingest_qb_customers, ingest_qb_items, ingest_qb_full_sync,
+    fetch_qb_chunk), que terminan todos acá.
+
+    Args:
+        fecha_inicio (str): Fecha de inicio en formato YYYY-MM-DD (requerido para backfill)
+        fecha_fin (str): Fecha de fin en formato YYYY-MM-DD (requerido para backfill)
+        chunk_days (int): Número de días por chunk (opcional, default: 7)
+        qb_base_url (str): URL base del API (opcional, default: sandbox de Intuit)
+        qb_token_url (str): URL para refrescar el token (opcional, default: Intuit OAuth)
+        qb_request_timeout (int): Timeout base por request en segundos (opcional, default: 60)
+        qb_fields (list | dict): Campos a proyectar en la query, como lista o por
+            entidad, p. ej. {'Invoice': ['Id', ...]} (opcional, default: todos)
+            En el UPSERT las propiedades traídas se mezclan sobre el payload ya
+            guardado, sin borrar el resto; request_payload registra
+            payload_schema.partial para distinguir la corrida.
+        log_level (str): DEBUG muestra el detalle por intento y por página; INFO
+            (default) solo el resumen por chunk; WARNING/ERROR solo problemas
+        metrics_dir (str): carpeta para el resumen JSON y el archivo Prometheus
+            de la corrida (opcional, default: <repo>/metrics/qb)
+        retry_failed_chunks (bool): un chunk que falla vuelve a la cola de reintentos,
+            partido en sub-ventanas más chicas, al final de la corrida (opcional, default: True)
+        max_chunk_retries (int): reintentos por chunk (opcional, default: 2)
+        retry_backoff_seconds (int): espera antes del primer reintento, se duplica
+            en cada uno (opcional, default: 5)
+        failed_chunks_path (str): JSON con las ventanas que siguieron fallando, por entidad
+            (opcional, default: <repo>/.variables/qb_failed_chunks.json)
+        retry_saved_chunks (bool): reprocesar en esta corrida las ventanas guardadas
+            (opcional, default: True)
+        verify_only (bool): solo mostrar los chunks que se procesarían (opcional, default: False)
+        skip_chunks (list): números de chunk a omitir (opcional)
+        force_chunks (list): números de chunk a reprocesar aunque estén en skip_chunks (opcional)
+        time_budget_seconds (int): plazo de la corrida; al vencer, cada chunk en curso
+            termina su página, el bloque devuelve lo leído (se exporta igual) y las
+            ventanas sin terminar quedan en checkpoint_path. Dejar margen para la
+            página en curso y sus reintentos (opcional, default: sin límite)
+        checkpoint_path (str): JSON con las ventanas pendientes de una corrida parcial,
+            por entidad (opcional, default: <repo>/.variables/qb_checkpoints.json)
+        resume_mode (bool): si hay un checkpoint del mismo rango (fecha_inicio, fecha_fin,
+            chunk_days), leer solo sus ventanas pendientes; los chunks cortados se releen
+            desde la primera página (opcional, default: True)
+        max_circuit_deferrals (int): veces que un chunk vuelve a la cola cuando el
+            circuit breaker está abierto antes de darlo por fallido (opcional, default: 3)
+        max_concurrency (int): tope de requests en vuelo por realm; los chunks se leen
+            en paralelo y un controlador AIMD por realm ajusta el límite real entre 1 y
+            este valor según 429, timeouts y latencia (opcional, default: 4)
+        initial_concurrency (int): límite inicial si no hay uno aprendido (opcional, default: 2)
+        concurrency_state_path (str): JSON con el límite aprendido por realm
+            (opcional, default: <repo>/.variables/qb_concurrency.json)
+        prefetch_pages (int): páginas siguientes pedidas por adelantado mientras se
+            procesa la actual, dentro de cada chunk; conviene en chunks de muchas
+            páginas (en los de una sola, duplica los requests) (opcional, default: 0)
+        qb_realms (list): compañías (realms) a sincronizar a la vez, por nombre; cada
+            una lee los secretos qb_<nombre>_realm_id, qb_<nombre>_access_token y
+            qb_<nombre>_refresh_token (y qb_<nombre>_client_id/_client_secret, o los
+            qb_client_* de la app) (opcional, default: un realm con los secretos
+            qb_realm_id, qb_access_token, ...)
+        max_parallel_realms (int): realms sincronizados a la vez (opcional, default: 4)
+        qb_client (str): 'threads' (requests, default) o 'async' (httpx + asyncio en
+            un solo hilo, para cientos de requests en vuelo con max_concurrency alto)
+        qb_cache (bool): guardar y reusar las páginas en una caché en disco, para
+            re-ejecuciones en modo edición sin gastar cuota (opcional, default: False)
+        qb_cache_dir (str): carpeta de la caché (opcional, default: <repo>/.variables/qb_cache)
+        qb_cache_ttl_seconds (int): vigencia de cada página (opcional, default: 86400)
+        qb_cache_max_mb (int): tope de la caché; se borran las páginas menos usadas
+            (opcional, default: 512)
+
+    Returns:
+        dict: {nombre de la entidad: DataFrame raw, con las filas de todos los realms}
+    """
+    qb_entities = [get_entity(name) for name in entity_names]
+    qb_client = kwargs.get('qb_client', 'threads')
+    if qb_client not in ('threads', 'async'):
+        raise ValueError(f"qb_client inválido '{qb_client}'. Use 'threads' o 'async'")
+    # None es el realm por defecto (secretos qb_*)
+    realm_names = kwargs.get('qb_realms') or [None]
+    if len(set(realm_names)) != len(realm_names):
+        raise ValueError(f"qb_realms tiene realms repetidos: {realm_names}")
+
+    # un solo plazo para todos los realms y entidades, contado desde el inicio de la corrida
+    if kwargs.get('time_budget_seconds'):
+        kwargs = {**kwargs, 'time_budget_deadline': time.time() + kwargs['time_budget_seconds']}
+
+    # concurrencia adaptativa (AIMD) por realm; arranca del último límite aprendido
+    concurrency_state_path = kwargs.get('concurrency_state_path', os.path.join(get_repo_path(), '.variables', 'qb_concurrency.json'))
+    learned_limits = load_limits(concurrency_state_path)
+    new_controller = get_async_controller if qb_client == 'async' else get_controller
+
+    # una caché para todos los realms: el realm es parte de la clave de cada página
+    cache = None
+    if kwargs.get('qb_cache', False):
+        cache = PageCache(
+            kwargs.get('qb_cache_dir', os.path.join(get_repo_path(), '.variables', 'qb_cache')),
+            ttl_seconds=kwargs.get('qb_cache_ttl_seconds', 86400),
+            max_bytes=kwargs.get('qb_cache_max_mb', 512) * 1024 * 1024,
+        )
+        print(f"Caché de páginas: {cache.cache_dir} ({cache.snapshot()['size_mb']} MB)")
+
+    realms = []
+    for realm_name in realm_names:
+        realm_id = realm_secret('realm_id', realm_name)
+        if not realm_id:
+            raise ValueError(f"Falta el secreto {'qb_realm_id' if realm_name is None else f'qb_{realm_name}_realm_id'}")
+        controller_name = f'quickbooks:{realm_id}'
+        # URLs y timeout configurables (p. ej. para apuntar al servidor mock de benchmarks)
+        realms.append({
+            'realm_id': realm_id,
+            'realm_name': realm_name,
+            'access_token': realm_secret('access_token', realm_name),
+            'base_url': kwargs.get('qb_base_url', QB_BASE_URL),
+            'token_url': kwargs.get('qb_token_url', QB_TOKEN_URL),
+            'base_timeout': kwargs.get('qb_request_timeout', 60),
+            'controller': new_controller(
+                controller_name,
+                initial_limit=learned_limits.get(controller_name, kwargs.get('initial_concurrency', 2)),
+                max_limit=kwargs.get('max_concurrency', 4),
+            ),
+            'cache': cache,
+        })
+    max_parallel_realms = kwargs.get('max_parallel_realms', 4)
+    if len(realms) > 1:
+        print(f"SINCRONIZANDO {len(realms)} REALMS (hasta {max_parallel_realms} a la vez): "
+              f"{', '.join(str(realm['realm_name']) for realm in realms)}")
+
+    if qb_client == 'async':
+        # import diferido: qb_async importa este módulo
+        from scheduler.utils.qb_async import run_coroutine, sync_realms_async
+        realm_frames = run_coroutine(sync_realms_async(realms, qb_entities, kwargs))
+    elif len(realms) == 1:
+        realm_frames = [_sync_realm(realms[0], qb_entities, kwargs)]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_parallel_realms, len(realms))) as executor:
+            futures = {
+                realm['realm_id']: executor.submit(
+                    contextvars.copy_context().run, _sync_realm, realm, qb_entities, kwargs,
+                )
+                for realm in realms
+            }
+        realm_frames = list(_collect(futures).values())
+
+    try:
+        save_limits(concurrency_state_path, [realm['controller'] for realm in realms])
+    except OSError as e:
+        print(f"No se pudo guardar el límite de concurrencia en {concurrency_state_path}: {e}")
+
+    if len(realm_frames) == 1:
+        return realm_frames[0]
+    return {
+        qb_entity.name: pd.concat([frames[qb_entity.name] for frames in realm_frames], ignore_index=True)
+        for qb_entity in qb_entities
+    }
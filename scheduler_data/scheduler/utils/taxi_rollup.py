@@ -0,0 +1,37 @@
+from pandas import DataFrame
+
+
+PICKUP_COLUMN = 'tpep_pickup_datetime'
+ROLLUP_TABLE = 'taxi_trips_hourly_rollup'
+ROLLUP_KEYS = ['hour_start', 'PULocationID', 'payment_type']
+ROLLUP_MEASURES = ['trips', 'revenue', 'distance']
+# PULocationID / payment_type missing in the source (e.g. 2021-01 payment_type)
+UNKNOWN_KEY = 0
+
+
+def build_hourly_rollup(df: DataFrame) -> DataFrame:
+    """
+    Aggregates the batch to trips, revenue (total_amount) and distance per
+    pickup hour x PULocationID x payment_type. Rows flagged invalid by
+    ny_taxi_clean are left out. Missing location or payment type is grouped
+    under UNKNOWN_KEY, so those trips still count and the keys stay int64.
+    """
+    if 'is_valid' in df.columns:
+        df = df[df['is_valid']]
+    keys = [
+        df[col].fillna(UNKNOWN_KEY).astype('int64')
+        for col in ROLLUP_KEYS if col != 'hour_start'
+    ]
+    rollup = (
+        df.groupby(
+            [df[PICKUP_COLUMN].dt.floor('h').rename('hour_start'), *keys],
+            sort=False,
+        )
+        .agg(
+            trips=('total_amount', 'size'),
+            revenue=('total_amount', 'sum'),
+            distance=('trip_distance', 'sum'),
+        )
+        .reset_index()
+    )
+    return rollup[ROLLUP_KEYS + ROLLUP_MEASURES]